@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import subprocess
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'hl_updi'))
+
+import offline
+import traffic
+from dataarray import DataArray
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.json')
+
+# hla methods timed individually for the per-state breakdown
+HANDLERS = ('capture_start', 'capture_opcode', 'capture_address', 'capture_data', 'capture_ack', 'capture_complete', 'complete_command', 'block_command', 'complete_block', 'addframe')
+
+def version():
+    with open(os.path.join(ROOT, 'hl_updi', 'extension.json')) as file:
+        label = json.load(file)['version']
+    try:
+        revision = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = ''
+    return '%s-%s' % (label, revision) if revision else label
+
+def frames_for(records):
+    return [offline.byte_frame(record) for record in records]
+
+def run(frames, analyzer):
+    output = 0
+    for frame in frames:
+        result = analyzer.decode(frame)
+        if result:
+            output += len(result)
+    return output
+
+# Wrap each handler on the instance so time spent in it is accumulated
+def instrument(analyzer, totals):
+    for name in HANDLERS:
+        method = getattr(analyzer, name, None)
+        if method == None:
+            continue
+        def timed(*args, _method=method, _name=name):
+            start = time.perf_counter()
+            try:
+                return _method(*args)
+            finally:
+                totals[_name] = totals.get(_name, 0.0) + time.perf_counter() - start
+        setattr(analyzer, name, timed)
+    # Dispatch through the wrapped handlers
+    if hasattr(analyzer, 'state_handlers'):
+        analyzer.handlers = analyzer.state_handlers()
+
+def measure(records, repeat=3, **settings):
+    frames = frames_for(records)
+
+    # Throughput, best of several runs
+    best = None
+    for _ in range(repeat):
+        analyzer = offline.create_analyzer(**settings)
+        start = time.perf_counter()
+        output = run(frames, analyzer)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+
+    # Time per handler (instrumented separately so it does not skew throughput)
+    totals = {}
+    analyzer = offline.create_analyzer(**settings)
+    instrument(analyzer, totals)
+    run(frames, analyzer)
+
+    # Peak memory, keeping the output frames like Logic 2 does
+    analyzer = offline.create_analyzer(**settings)
+    tracemalloc.start()
+    kept = []
+    for frame in frames:
+        result = analyzer.decode(frame)
+        if result:
+            kept.extend(result)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'bytes'             : len(records),
+        'frames'            : output,
+        'seconds'           : best,
+        'bytes_per_sec'     : len(records) / best,
+        'frames_per_sec'    : output / best,
+        'handlers'          : totals,
+        'peak_bytes'        : peak,
+    }
+
+# Micro benchmarks of the known hot spots
+def micro():
+    analyzer = offline.create_analyzer()
+    analyzer.load_tables()
+    analyzer.command.repeat_byte = None
+    frame = offline.byte_frame((0, 0, 0x80))
+    payload = DataArray([0x55, 0x64, 0x12, 0x40])
+    number = 100000
+    return {
+        'capture_opcode_us'     : timeit.timeit(lambda: analyzer.capture_opcode(0x8B, frame), number=number) / number * 1e6,
+        'register_data_us'      : timeit.timeit(lambda: analyzer.register_data(0x0B, 0x82), number=number) / number * 1e6,
+        'toHexString_us'        : timeit.timeit(lambda: payload.toHexString(isSpace=True), number=number) / number * 1e6,
+    }
+
+def compare(previous, current):
+    for name, result in current['workloads'].items():
+        if name not in previous['workloads']:
+            continue
+        before = previous['workloads'][name]['bytes_per_sec']
+        print('  %-10s %+7.1f%% bytes/sec vs %s' % (name, (result['bytes_per_sec'] / before - 1) * 100, previous['version']))
+    for name, value in current['micro'].items():
+        if name in previous['micro']:
+            print('  %-20s %+7.1f%%' % (name, (value / previous['micro'][name] - 1) * 100))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the UPDI high level analyzer')
+    parser.add_argument('workloads', nargs='*', help='Workloads to run (default: all)')
+    parser.add_argument('--records', action='append', default=[], help='CSV byte records exported from Logic 2 (e.g. the Samples sessions)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--setting', action='append', default=[], help='hla setting as NAME=VALUE, e.g. RepeatFrames=Block')
+    parser.add_argument('--results', default=RESULTS, help='JSON file results are tracked in')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args(argv)
+
+    workloads = {}
+    for name in (args.workloads or traffic.WORKLOADS):
+        workloads[name] = traffic.WORKLOADS[name]()
+    for path in args.records:
+        workloads[os.path.basename(path)] = list(offline.read_records(path))
+
+    settings = {}
+    for setting in args.setting:
+        name, value = setting.split('=', 1)
+        settings[name] = int(value) if value.isdigit() else value
+
+    current = {'version': version(), 'python': sys.version.split()[0], 'settings': settings, 'workloads': {}, 'micro': micro()}
+    for name, records in workloads.items():
+        result = measure(records, args.repeat, **settings)
+        current['workloads'][name] = result
+        print('%-10s %9d bytes %8d frames %10.0f bytes/s %10.0f frames/s %8.1f KiB peak' % (
+            name, result['bytes'], result['frames'], result['bytes_per_sec'], result['frames_per_sec'], result['peak_bytes'] / 1024))
+        for handler, seconds in sorted(result['handlers'].items(), key=lambda item: -item[1]):
+            print('    %-18s %8.3f s' % (handler, seconds))
+    for name, value in current['micro'].items():
+        print('%-20s %8.3f us' % (name, value))
+
+    history = []
+    if os.path.exists(args.results):
+        with open(args.results) as file:
+            history = json.load(file)
+    if history:
+        print('Compared to previous run:')
+        compare(history[-1], current)
+    if not args.no_save:
+        history.append(current)
+        with open(args.results, 'w') as file:
+            json.dump(history, file, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import random
+
+# Synthetic UPDI traffic, as (start_time, end_time, byte) records
+
+SYNC = 0x55
+ACK = 0x40
+IDLE = 0xFF
+BREAK = 0x00
+
+# 12 bit frames (start, 8 data, parity, 2 stop)
+FRAME_BITS = 12
+
+SIB = b'tinyAVR P:0D:0-3M2 (00.59B15.0)\x00'
+KEY_NVMPROG = b' gorPMVN'
+
+class Traffic:
+
+    def __init__(self, baud=225000, seed=0):
+        self.bit_time = 1.0 / baud
+        self.time = 0.0
+        self.records = []
+        self.random = random.Random(seed)
+
+    def byte(self, value, gap=0):
+        start_time = self.time + gap * self.bit_time
+        end_time = start_time + FRAME_BITS * self.bit_time
+        self.records.append((start_time, end_time, value))
+        self.time = end_time
+        return self
+
+    def bytes(self, values, gap=0):
+        for value in values:
+            self.byte(value, gap)
+        return self
+
+    # STCS / LDCS
+    def stcs(self, cs, value):
+        return self.bytes((SYNC, 0xC0 | cs, value))
+
+    def ldcs(self, cs, value):
+        self.bytes((SYNC, 0x80 | cs))
+        return self.byte(value, gap=2)
+
+    def key(self, key=KEY_NVMPROG):
+        return self.bytes((SYNC, 0xE0)).bytes(key)
+
+    def key_sib(self, sib=SIB):
+        self.bytes((SYNC, 0xE6))
+        return self.bytes(sib, gap=2)
+
+    # ST ptr (word address), then REPEAT + ST *(ptr++) of the page
+    def write_page(self, address, data):
+        self.bytes((SYNC, 0x69, address & 0xFF, (address >> 8) & 0xFF)).byte(ACK, gap=2)
+        count = len(data) - 1
+        self.bytes((SYNC, 0xA0, count & 0xFF))
+        self.bytes((SYNC, 0x64))
+        for value in data:
+            self.byte(value).byte(ACK, gap=2)
+        return self
+
+    def idle(self, count):
+        return self.bytes([IDLE] * count)
+
+    def brk(self, count=1):
+        return self.bytes([BREAK] * count)
+
+#########################################################################################
+# Workloads
+#########################################################################################
+
+# Debugger refresh: STATUSA / ASI_SYS_STATUS polling
+def polling(commands=20000, seed=0):
+    traffic = Traffic(seed=seed)
+    traffic.stcs(0x03, 0x08)
+    for index in range(commands):
+        if index & 1:
+            traffic.ldcs(0x0B, traffic.random.choice((0x82, 0x82, 0x82, 0xA3, 0x21)))
+        else:
+            traffic.ldcs(0x00, 0x30)
+    return traffic.records
+
+# Programming session start: KEY SIB and NVMPROG keys
+def keys(commands=2000, seed=0):
+    traffic = Traffic(seed=seed)
+    for index in range(commands):
+        traffic.key_sib() if index & 1 else traffic.key()
+        traffic.ldcs(0x07, 0x10)
+    return traffic.records
+
+# Flash programming: REPEAT + ST *(ptr++) bursts
+def flash(pages=64, page_size=64, seed=0):
+    traffic = Traffic(seed=seed)
+    for page in range(pages):
+        data = bytes(traffic.random.randrange(256) for _ in range(page_size))
+        traffic.write_page(0x8000 + page * page_size, data)
+        traffic.ldcs(0x0B, 0x08)
+    return traffic.records
+
+# Long IDLE and BREAK runs between short bursts
+def idle(runs=200, length=200, seed=0):
+    traffic = Traffic(seed=seed)
+    for run in range(runs):
+        traffic.idle(length).brk(2).ldcs(0x00, 0x30)
+    return traffic.records
+
+# A bit of everything
+def mixed(seed=0):
+    records = []
+    offset = 0.0
+    for workload in (idle(20, 100, seed), keys(20, seed), polling(2000, seed), flash(16, 64, seed), polling(2000, seed)):
+        records.extend((start + offset, end + offset, value) for start, end, value in workload)
+        offset = records[-1][1]
+    return records
+
+WORKLOADS = {
+    'polling'   : polling,
+    'keys'      : keys,
+    'flash'     : flash,
+    'idle'      : idle,
+    'mixed'     : mixed,
+}
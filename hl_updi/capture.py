@@ -0,0 +1,115 @@
+import os
+import sys
+import array
+import struct
+from collections import namedtuple
+
+import offline
+import edges
+
+#########################################################################################
+# Logic 2 capture files
+#
+# Channel data is read in the Logic 2 binary export format (File > Export Raw Data >
+# Binary, digital channels, versions 0 and 1): the initial level, begin and end time
+# and the transition times as doubles, READ_TRANSITIONS at a time, so only one read
+# buffer of the channel is in memory at a time, whatever the size of the capture.
+#
+# .sal sessions are not read.  The digital-N.bin members Logic 2 writes into them use
+# an internal format instead (version 1, type 100: chunks of compressed transitions
+# with display summaries).  That encoding is not documented, so those channels are
+# refused with a CaptureError saying to export the channel as binary, rather than
+# decoded by guesswork.
+#########################################################################################
+
+SALEAE_MAGIC = b'<SALEAE>'
+
+# Channel types in the binary header
+DIGITAL_TYPE = 0
+SESSION_TYPE = 100
+
+# Transition times read per chunk
+READ_TRANSITIONS = 1 << 16
+
+class CaptureError(ValueError):
+    pass
+
+DigitalHeader = namedtuple('DigitalHeader', [
+    'version',          # Export format version
+    'initial_state',    # Level of the channel at begin_time
+    'begin_time',       # Seconds
+    'end_time',         # Seconds
+    'transitions',      # Number of transition times that follow
+])
+
+def read_exact(file, size, source):
+    data = file.read(size)
+    if len(data) != size:
+        raise CaptureError('%s: truncated' % source)
+    return data
+
+def read_digital_header(file, source):
+    magic, version, type = struct.unpack('<8sii', read_exact(file, 16, source))
+    if magic != SALEAE_MAGIC:
+        raise CaptureError('%s: not a Saleae binary file' % source)
+    if type == SESSION_TYPE:
+        raise CaptureError('%s: channel data is in the internal Logic 2 session format, which is not documented.  '
+                           'Open the capture in Logic 2 and use File > Export Raw Data > Binary for this channel' % source)
+    if type != DIGITAL_TYPE:
+        raise CaptureError('%s: not a digital channel (type %d)' % (source, type))
+    if version not in (0, 1):
+        raise CaptureError('%s: unsupported binary format version %d' % (source, version))
+    initial_state, begin_time, end_time, transitions = struct.unpack('<IddQ', read_exact(file, 28, source))
+    return DigitalHeader(version, initial_state, begin_time, end_time, transitions)
+
+# Transition times, a chunk (array of doubles) at a time
+def iter_transition_chunks(file, header, source, size=READ_TRANSITIONS):
+    remaining = header.transitions
+    while remaining > 0:
+        count = min(size, remaining)
+        chunk = array.array('d')
+        chunk.frombytes(read_exact(file, count * 8, source))
+        if sys.byteorder != 'little':
+            chunk.byteswap()
+        remaining -= count
+        yield chunk
+
+#########################################################################################
+# Capture files to frames
+#########################################################################################
+
+# Is path a capture file rather than a CSV of byte records?  .sal sessions are refused:
+# the channel data Logic 2 keeps in them is in its internal format (see above).
+def is_capture_file(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.sal':
+        raise CaptureError('%s: .sal sessions are not supported.  '
+                           'Open the capture in Logic 2 and use File > Export Raw Data > Binary for the UPDI channel' % path)
+    return extension == '.bin'
+
+# Header and transition times (in chunks) of a binary export file.  The file stays open
+# until the transitions have all been read.
+def read_channel(path):
+    file = open(path, 'rb')
+    try:
+        header = read_digital_header(file, path)
+    except CaptureError:
+        file.close()
+        raise
+
+    def chunks():
+        try:
+            yield from iter_transition_chunks(file, header, path)
+        finally:
+            file.close()
+    return header, chunks()
+
+# ll_updi frames for the UPDI channel in a capture file, decoded a block of edges at a
+# time with NumPy when it is installed
+def iter_capture_frames(path):
+    header, chunks = read_channel(path)
+    return edges.iter_edge_frames(header.initial_state, chunks, header.begin_time)
+
+# Decode a capture file through ll_updi and hla, yielding hla frames
+def iter_decode_capture(path, analyzer=None, **settings):
+    return offline.iter_decode_frames(iter_capture_frames(path), analyzer, **settings)
@@ -0,0 +1,267 @@
+import sys
+import argparse
+from collections import namedtuple
+
+import offline
+import capture
+from polling import POLL_PERIOD, signature
+
+#########################################################################################
+# Comparing two decoded captures
+#
+# A board that fails programming is compared with a golden capture of the same
+# session.  Each decoded frame is reduced to what was said on the bus (its payload
+# bytes, opcode, address, data and ACK, all in the payload, and its mnemonic), without
+# any times, and each distinct command is given a small number.  Polling runs are then
+# collapsed (any sequence of up to POLL_PERIOD commands repeated back to back, whatever
+# the number of repeats), so a target that answered a few polls sooner or later is not
+# a difference.  IDLE frames are only time between commands and are left out.
+#
+# The two sequences of numbers are aligned with Myers' O(ND) algorithm, in its linear
+# space form: the middle snake of the edit path is found from both ends at once and
+# each half is aligned in turn.  Common runs at the start and end are skipped before
+# every step, so sessions that only differ in a few places are compared in about one
+# pass over the commands.  Regions where the sequences differ by more than COST_LIMIT
+# edits at once are reported as one region rather than aligned further.
+#########################################################################################
+
+# Edit distance searched for in one step before a region is given up on as different
+COST_LIMIT = 1024
+
+# Frames shown from each side of a region
+REGION_FRAMES = 8
+
+# Commands of a region: golden[golden_start:golden_end] against other[other_start:other_end]
+Region = namedtuple('Region', ['golden_start', 'golden_end', 'other_start', 'other_end'])
+
+# Frames to compare, how often each was repeated back to back, and their command
+# numbers.  keys maps each distinct command (or repeated sequence of commands) to its
+# number and is shared by both captures.
+def command_sequence(frames, keys, period=POLL_PERIOD):
+    kept = []
+    numbers = []
+    for frame in frames:
+        if frame.data.get('command') == 'IDLE':
+            continue
+        key = signature(frame)
+        number = keys.get(key)
+        if number == None:
+            number = keys[key] = len(keys)
+        kept.append(frame)
+        numbers.append(number)
+
+    # Polling runs: any sequence of up to period commands repeated back to back, taken
+    # from the left.  Runs are numbered by the repeated sequence alone.
+    compared = []
+    repeats = []
+    sequence = []
+    index = 0
+    count = len(numbers)
+    while index < count:
+        number = numbers[index]
+        for length in range(1, period + 1):
+            end = index + 2 * length
+            if end > count or numbers[index + length] != number or numbers[index:index + length] != numbers[index + length:end]:
+                continue
+            pattern = numbers[index:index + length]
+            while numbers[end:end + length] == pattern:
+                end += length
+            key = ('POLL',) + tuple(pattern)
+            number = keys.get(key)
+            if number == None:
+                number = keys[key] = len(keys)
+            repeats.append((end - index) // length)
+            break
+        else:
+            end = index + 1
+            repeats.append(1)
+        compared.append(kept[index])
+        sequence.append(number)
+        index = end
+    return compared, repeats, sequence
+
+#########################################################################################
+# Alignment
+#########################################################################################
+
+# Regions where a[a0:a1] and b[b0:b1] differ, in order
+def diff_sequences(a, b, a0=0, a1=None, b0=0, b1=None, limit=COST_LIMIT):
+    a1 = len(a) if a1 == None else a1
+    b1 = len(b) if b1 == None else b1
+    regions = []
+    # Halves still to align, last first
+    pending = [(a0, a1, b0, b1)]
+    while pending:
+        a0, a1, b0, b1 = pending.pop()
+
+        # Common start and end
+        while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+            a0 += 1
+            b0 += 1
+        while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+            a1 -= 1
+            b1 -= 1
+        if a0 == a1 and b0 == b1:
+            continue
+        if a0 == a1 or b0 == b1:
+            add_region(regions, Region(a0, a1, b0, b1))
+            continue
+
+        split = middle_snake(a, a0, a1, b, b0, b1, limit)
+        if split == None:
+            add_region(regions, Region(a0, a1, b0, b1))
+            continue
+        x, y = split
+        pending.append((x, a1, y, b1))
+        pending.append((a0, x, b0, y))
+    return regions
+
+# Regions come out in order, touching ones are one region
+def add_region(regions, region):
+    if regions and regions[-1].golden_end == region.golden_start and regions[-1].other_end == region.other_start:
+        last = regions.pop()
+        region = Region(last.golden_start, region.golden_end, last.other_start, region.other_end)
+    regions.append(region)
+
+# A point on an optimal edit path between a[a0:a1] and b[b0:b1], found by running the
+# O(ND) search forwards from the start and backwards from the end until they meet.
+# Neither range may be empty.  None when the ranges are more than limit edits apart.
+def middle_snake(a, a0, a1, b, b0, b1, limit):
+    n = a1 - a0
+    m = b1 - b0
+    rounds = min((n + m + 1) // 2, limit)
+    offset = rounds + 1
+    size = 2 * offset + 1
+    # Furthest x reached on each diagonal k = x - y, from the start and from the end
+    forward = [-1] * size
+    backward = [-1] * size
+    forward[offset + 1] = 0
+    backward[offset + 1] = 0
+    delta = n - m
+    odd = delta & 1
+    # Diagonals that ran off the edge of the grid are not searched again
+    forward_start = forward_end = backward_start = backward_end = 0
+
+    for d in range(rounds):
+        for k in range(-d + forward_start, d + 1 - forward_end, 2):
+            index = offset + k
+            if k == -d or (k != d and forward[index - 1] < forward[index + 1]):
+                x = forward[index + 1]
+            else:
+                x = forward[index - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            forward[index] = x
+            if x > n:
+                forward_end += 2
+            elif y > m:
+                forward_start += 2
+            elif odd:
+                other = offset + delta - k
+                if 0 <= other < size and backward[other] != -1 and x >= n - backward[other]:
+                    return a0 + x, b0 + y
+
+        for k in range(-d + backward_start, d + 1 - backward_end, 2):
+            index = offset + k
+            if k == -d or (k != d and backward[index - 1] < backward[index + 1]):
+                x = backward[index + 1]
+            else:
+                x = backward[index - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a1 - x - 1] == b[b1 - y - 1]:
+                x += 1
+                y += 1
+            backward[index] = x
+            if x > n:
+                backward_end += 2
+            elif y > m:
+                backward_start += 2
+            elif not odd:
+                other = offset + delta - k
+                if 0 <= other < size and forward[other] != -1:
+                    x1 = forward[other]
+                    y1 = x1 - (delta - k)
+                    if x1 >= n - x:
+                        return a0 + x1, b0 + y1
+    return None
+
+#########################################################################################
+# Comparing captures
+#########################################################################################
+
+class Comparison:
+
+    def __init__(self, golden, other, regions, golden_repeats=None, other_repeats=None):
+        self.golden = golden        # Frames compared from the golden capture, the first of each polling run
+        self.other = other          # Frames compared from the other capture
+        self.regions = regions
+        self.golden_repeats = golden_repeats or [1] * len(golden)
+        self.other_repeats = other_repeats or [1] * len(other)
+
+    def same(self):
+        return not self.regions
+
+    # First region, where the captures start to differ
+    def first_divergence(self):
+        return self.regions[0] if self.regions else None
+
+    def report(self, file=None, frames=REGION_FRAMES):
+        file = file or sys.stdout
+        if self.same():
+            print('Same %d commands' % len(self.golden), file=file)
+            return
+        print('%d differing regions, %d golden commands against %d' % (len(self.regions), len(self.golden), len(self.other)), file=file)
+        first = self.regions[0]
+        print('First divergence at command %d of the golden capture (%s), %d of the other (%s)' % (
+            first.golden_start, self.time(self.golden, first.golden_start), first.other_start, self.time(self.other, first.other_start)), file=file)
+        for region in self.regions:
+            print('@@ golden %d,%d other %d,%d @@' % (region.golden_start, region.golden_end - region.golden_start,
+                                                     region.other_start, region.other_end - region.other_start), file=file)
+            self.show(file, '-', self.golden, self.golden_repeats, region.golden_start, region.golden_end, frames)
+            self.show(file, '+', self.other, self.other_repeats, region.other_start, region.other_end, frames)
+
+    def time(self, frames, index):
+        return '%.6f s' % frames[index].start_time if index < len(frames) else 'end'
+
+    def show(self, file, mark, frames, repeats, start, end, limit):
+        for index in range(start, min(end, start + limit)):
+            frame = frames[index]
+            polled = '  (polling run x %d)' % repeats[index] if repeats[index] > 1 else ''
+            print('%s %12.6f  %-32s %-24s %s%s' % (mark, frame.start_time, frame.data['command'].strip(), frame.data['data'], frame.data['response'].strip(), polled), file=file)
+        if end - start > limit:
+            print('%s ... %d more' % (mark, end - start - limit), file=file)
+
+def compare_frames(golden_frames, frames, limit=COST_LIMIT):
+    keys = {}
+    golden, golden_repeats, golden_sequence = command_sequence(golden_frames, keys)
+    other, other_repeats, other_sequence = command_sequence(frames, keys)
+    return Comparison(golden, other, diff_sequences(golden_sequence, other_sequence, limit=limit), golden_repeats, other_repeats)
+
+# Decoded frames of a CSV of byte records or a capture file, with the settings that
+# keep every command as its own frame
+def decode_file(path, **settings):
+    settings = dict(settings, PollingFrames='Each', RepeatFrames='Each')
+    if capture.is_capture_file(path):
+        return list(capture.iter_decode_capture(path, **settings))
+    return offline.decode_records(offline.read_records(path), **settings)
+
+def compare_files(golden_path, path, **settings):
+    return compare_frames(decode_file(golden_path, **settings), decode_file(path, **settings))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the UPDI commands of a capture with a golden capture')
+    parser.add_argument('golden', help='Golden capture: CSV of byte records or binary export .bin')
+    parser.add_argument('capture', help='Capture to compare with it')
+    parser.add_argument('--frames', type=int, default=REGION_FRAMES, help='Frames shown from each side of a region')
+    args = parser.parse_args(argv)
+    try:
+        comparison = compare_files(args.golden, args.capture)
+    except ValueError as error:
+        parser.error(str(error))
+    comparison.report(frames=args.frames)
+    return 0 if comparison.same() else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
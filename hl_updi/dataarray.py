@@ -1,23 +1,31 @@
-class DataArray(list):
+from textcache import spaced_hex, packed_hex, quoted_text
 
+#########################################################################################
+# Payload, address and data bytes of the command being decoded
+#
+# hla keeps one DataArray of each and empties it in place for the next command.  As
+# with any bytearray, slicing one copies; only view() gives a zero-copy memoryview.
+# The decoder copies on purpose: frames keep bytes snapshots because the buffers are
+# reused, the string cache needs hashable keys, and for the few bytes of a command a
+# copy costs less than making a view.
+#########################################################################################
+
+class DataArray(bytearray):
+
+    # Formatted through the string cache, keyed on a bytes copy of the contents
     def toHexString(self, isSpace=False):
-        hex = '0x'
-        for item in self:
-            if (isSpace==True):
-                hex += '%02X ' % item
-            else:
-                hex += '%02X' % item
-        return hex.strip()
-    
+        return spaced_hex(bytes(self)) if isSpace == True else packed_hex(bytes(self))
+
     def toAsciiString(self):
-        ascii = '"'
-        for item in self:
-            ascii+=chr(item)
-        ascii += '"'
-        return ascii
-    
+        return quoted_text(bytes(self))
+
     def toTotal(self):
-        total = 0
-        for item in self:
-            total = (total << 8) + item
-        return total
\ No newline at end of file
+        return int.from_bytes(self, 'big')
+
+    # Zero-copy slice.  Release it before the array is appended to or reset.
+    def view(self, start=0, stop=None):
+        return memoryview(self)[start:stop]
+
+    # Empty in place so the buffer can be reused for the next frame
+    def reset(self):
+        del self[:]
@@ -0,0 +1,516 @@
+from collections import namedtuple
+
+from saleae.analyzers import AnalyzerFrame
+
+# NumPy is optional, without it every capture goes through the edge by edge port
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#########################################################################################
+# UPDI bytes from edge timestamps
+#
+# Python port of ll_analyzer::WorkerThread (ll_updi/src/ll_analyzer.cpp), for captures
+# decoded without Logic 2.  The input is the initial level of the UPDI line and the
+# times of its transitions, the output the same frames ll_updi gives hla: SYNC, DATA,
+# IDLE and BREAK, plus WRONG_BIT and NARROW while hunting for a SYNC.  The bit rate
+# is measured from each SYNC, so a debugger changing speed is followed as it is on
+# the bus.  Times are in seconds, as in a Logic 2 export, where ll_updi counts samples.
+#########################################################################################
+
+# A long low this many bits wide is a BREAK while synchronized
+BREAK_BITS = 13
+
+# Edge times one transition at a time, with the next edge always known (GetSampleOfNextEdge)
+class Channel:
+
+    def __init__(self, initial_state, transitions, begin_time=0.0):
+        self.transitions = iter(transitions)
+        self.state = 1 if initial_state else 0
+        self.position = begin_time
+        self.next_edge = next(self.transitions, None)
+
+    def advance_to_next_edge(self):
+        self.position = self.next_edge
+        self.state ^= 1
+        self.next_edge = next(self.transitions, None)
+
+    # Move forward in time, crossing any edges on the way
+    def advance(self, width):
+        target = self.position + width
+        while self.next_edge != None and self.next_edge <= target:
+            self.advance_to_next_edge()
+        self.position = target
+
+class EdgeDecoder:
+
+    def __init__(self, initial_state, transitions, begin_time=0.0):
+        self.channel = Channel(initial_state, transitions, begin_time)
+        self.bit_rate = 0.0
+        self.count = 0
+        self.frames = []
+
+        # unsynced() state (static locals in ll_analyzer)
+        self.sync_bit_count = 0
+        self.sync_start = 0.0
+        self.last_bit = 0.0
+
+        # synced() state
+        self.data_bit_count = 0
+        self.data_start_bit = 0.0
+        self.data_value = 0
+
+    def identify(self, start, end, note, value, baud=None):
+        self.count += 1
+        data = {'count': self.count, 'data': bytes((value & 0xFF,))}
+        if baud != None:
+            data['command'] = '(Baud Rate: %g)' % baud
+        self.frames.append(AnalyzerFrame(note, start, end, data))
+
+    # Frame from here to the next edge
+    def identify_pulse(self, note, value):
+        channel = self.channel
+        self.identify(channel.position, channel.next_edge, note, value)
+
+    # Frame from an earlier start to half a bit from here
+    def identify_from(self, start, note, value, baud=None):
+        self.identify(start, self.channel.position + self.bit_rate / 2, note, value, baud)
+
+    def valid(self, previous, bit, width=0):
+        channel = self.channel
+        this_width = channel.next_edge - channel.position
+        if width == 0:
+            width = self.bit_rate
+        if channel.state != bit:
+            self.identify_pulse('WRONG_BIT', -1)
+            return False
+        elif this_width < width * .75:
+            self.identify_pulse('NARROW', -1)
+            return False
+        elif previous and this_width > width * 1.25:
+            if channel.state == 1:
+                self.identify_from(previous, 'BREAK', 0x00)
+                self.identify_pulse('IDLE', 0xFF)
+            else:
+                self.identify_pulse('BREAK', 0x00)
+            return False
+        return True
+
+    # Not yet synchronized to the bit rate, returns True while still unsynced
+    def unsynced(self):
+        channel = self.channel
+        if self.sync_bit_count == 0:
+            # LOW is start of a SYNC
+            # 0 1234567 8  9
+            # S 0123456 7P SS
+            # L HLHLHLH LL HH
+            if channel.state == 0:
+                self.sync_start = channel.position
+                self.bit_rate = channel.next_edge - channel.position
+                self.sync_bit_count += 1
+            else:
+                self.identify_pulse('IDLE', 0xFF)
+                self.sync_bit_count = 0
+        elif self.sync_bit_count < 8:
+            # Check the widths of subsequent single wide bits
+            if not self.valid(self.last_bit, self.sync_bit_count & 0x01):
+                self.sync_bit_count = 0
+                self.sync_start = 0.0
+            else:
+                self.sync_bit_count += 1
+        elif self.sync_bit_count == 8:
+            if not self.valid(0, 0, self.bit_rate * 2):
+                self.sync_bit_count = 0
+                self.sync_start = 0.0
+            else:
+                self.sync_bit_count += 1
+        else:
+            if not self.valid(0, 1, self.bit_rate * 2):
+                self.sync_bit_count = 0
+                self.sync_start = 0.0
+            else:
+                # Averaged over the whole SYNC for the reported baud rate, bytes are
+                # sampled with the start bit width (bit_rate is shadowed in ll_analyzer)
+                average = (channel.position - self.sync_start) / 10
+                channel.advance(average)
+                self.identify_from(self.sync_start, 'SYNC', 0x55, 1 / average if average > 0 else None)
+                self.sync_start = 0.0
+                self.sync_bit_count = 0
+                return False
+
+        # Default is that we are not synced
+        self.last_bit = channel.position
+        return True
+
+    # Synchronized to the bit rate, returns True while still synchronized
+    def synced(self):
+        channel = self.channel
+        bit_rate = self.bit_rate
+        bit_width = channel.next_edge - channel.position
+        if channel.state == 0 and bit_width > bit_rate * BREAK_BITS:
+            self.identify_pulse('BREAK', 0x00)
+            self.data_bit_count = 0
+            return False
+
+        if bit_width < bit_rate * .75:
+            # Too small, could be a speed change
+            # Immediately jump to an unsynced condition at the current bit
+            self.data_bit_count = 0
+            return not self.unsynced()
+
+        if channel.state == 1 and self.data_bit_count == 0:
+            self.identify_pulse('IDLE', 0xFF)
+            return True
+
+        if channel.state == 0 and self.data_bit_count == 0:
+            # START BIT
+            self.data_bit_count = 1
+
+        # Process as many logical bits as there are in this physical pulse
+        channel.advance(bit_rate / 2)
+        while True:
+            count = self.data_bit_count
+            if count == 1:
+                self.data_value = 0
+                self.data_start_bit = channel.position
+            elif count <= 9:
+                if channel.state:
+                    self.data_value += 1 << (count - 2)
+            elif count == 12:
+                # Stop bit 2, parity and stop bit 1 are not checked
+                self.data_bit_count = 0
+                if self.data_value == 0x55:
+                    self.identify_from(self.data_start_bit, 'SYNC', 0x55)
+                else:
+                    self.identify_from(self.data_start_bit, 'DATA', self.data_value)
+                return True
+            self.data_bit_count += 1
+            bit_width -= bit_rate
+            if bit_width <= bit_rate * .5:
+                break
+            channel.advance(bit_rate)
+        return True
+
+    # Decode every edge, yielding frames as they complete
+    def __iter__(self):
+        channel = self.channel
+        if channel.next_edge == None:
+            return
+
+        # We should start at high state (IDLE) at the beginning of a capture
+        # If we are starting low consider it an initial break
+        if channel.state == 0:
+            self.identify_pulse('BREAK', 0x00)
+            channel.advance_to_next_edge()
+
+        is_synced = False
+        while channel.next_edge != None:
+            is_synced = self.synced() if is_synced else not self.unsynced()
+            if self.frames:
+                yield from self.frames
+                self.frames = []
+            if channel.next_edge == None:
+                break
+            channel.advance_to_next_edge()
+
+        # The stop bits of the last byte have no edge after them, finish it on its own
+        if is_synced and channel.state == 1 and self.data_bit_count > 0:
+            channel.next_edge = channel.position + self.bit_rate * (13 - self.data_bit_count)
+            self.synced()
+            yield from self.frames
+            self.frames = []
+
+# Frames for a channel given its level at begin_time and its transition times
+def decode_edges(initial_state, transitions, begin_time=0.0):
+    return iter(EdgeDecoder(initial_state, transitions, begin_time))
+
+#########################################################################################
+# Vectorized decoder
+#
+# The same decoding on whole arrays of edges, with NumPy.  Pulse widths are compared
+# for every position at once to find the SYNC patterns (a start bit, seven single bits
+# alternating, two bits low, two high), each giving the bit rate as a tenth of its
+# length.  A BREAK (low for more than BREAK_BITS bits) or a NARROW pulse ends a
+# synchronized stretch, and the first SYNC after it starts the next one, as in
+# ll_analyzer.  Within a stretch every falling edge knows where the byte starting
+# there ends, so the byte starts are the chain of "first falling edge after the
+# previous stop bits" from the SYNC, found for all bytes at once by pointer doubling.
+# The twelve bits of every byte are then sampled in the middle from the few edges
+# that follow its start, one edge position at a time across all bytes.
+#
+# Unlike ll_analyzer, parity and stop bits are checked: bytes with a wrong parity or a
+# low stop (or high start) bit are reported as PARITY_ERROR and FRAMING_ERROR frames
+# carrying the byte as sampled.  Pulses outside any byte are reported as ll_analyzer
+# does while unsynchronized: IDLE when high, BREAK, NARROW or WRONG_BIT when low.
+#########################################################################################
+
+# Frame types of decode_edge_arrays, by kind number
+EDGE_KINDS = ('SYNC', 'DATA', 'IDLE', 'BREAK', 'WRONG_BIT', 'NARROW', 'PARITY_ERROR', 'FRAMING_ERROR')
+SYNC_KIND, DATA_KIND, IDLE_KIND, BREAK_KIND, WRONG_BIT_KIND, NARROW_KIND, PARITY_KIND, FRAMING_KIND = range(len(EDGE_KINDS))
+
+# Edges decoded per call of decode_edge_arrays when streaming
+EDGE_BLOCK = 1 << 20
+
+# Bits of a UPDI frame: start, 8 data, even parity, 2 stop
+FRAME_BITS = 12
+ALL_BITS = (1 << FRAME_BITS) - 1
+
+# Falling edges after the start of a byte checked directly for the next one
+LOOKAHEAD = 6
+
+# The byte after this one can start at the first falling edge after its second stop bit
+STOP_SAMPLE = FRAME_BITS - 0.5
+
+def parity_table():
+    return numpy.array([bin(value).count('1') & 1 for value in range(256)], dtype=numpy.uint8)
+
+PARITY = parity_table() if numpy != None else None
+
+# First pulse from start on that ends a stretch at this bit rate, looked for in
+# growing windows so a stretch costs about its own length
+def first_boundary(widths, initial, start, rate, window=4096):
+    while start < len(widths):
+        part = widths[start:start + window]
+        low = (numpy.arange(start, start + len(part)) & 1) == initial
+        found = numpy.flatnonzero((part < rate * .75) | (low & (part > rate * BREAK_BITS)))
+        if len(found):
+            return start + found[0]
+        start += window
+        window *= 2
+    return len(widths)
+
+# What one block hands on to the next: the bit rate of a byte starting at its first
+# edge (None when there is none), whether that byte is the SYNC starting a stretch, and
+# the bit rate of the last stretch, for the pulses in front of the first one
+Carry = namedtuple('Carry', ['rate', 'measured', 'reference'])
+
+NO_CARRY = Carry(None, False, None)
+
+# Decode one block of edges.  times are the transition times, initial_state the level
+# before the first of them from begin_time, carry what the previous block handed on.
+# Unless final, decoding stops at the start of the last byte, which may be cut off by
+# the end of the block, or with no byte in front of the last few edges, which may be
+# the start of a SYNC: cut is the index of the first edge not decoded, to be passed
+# again with the next block (0, with nothing decoded, when that is the first edge).
+# Returns (start, end, value, kind, baud, cut, carry), baud being the measured baud
+# rate on the SYNC frames that start a synchronized stretch, NaN elsewhere.
+def decode_edge_arrays(times, initial_state, begin_time=0.0, carry=NO_CARRY, final=True):
+    times = numpy.asarray(times, dtype=numpy.float64)
+    count = len(times)
+    initial = 1 if initial_state else 0
+
+    # Pulse p runs from edge p-1 to edge p, pulse 0 from begin_time to the first edge.
+    # Pulse p is low when (p & 1) == initial.
+    starts = numpy.concatenate(([begin_time], times))
+    ends = numpy.concatenate((times, [numpy.inf]))
+    widths = ends - starts
+    pulses = count + 1
+
+    # SYNC patterns: L H L H L H L H (single bits), LL (bit 7 and parity), HH (stop bits).
+    # Each pulse of the pattern narrows the low pulses down further, so only the first
+    # checks see every pulse.  The last pulse of a block that is not the last has no end
+    # yet, so no pattern is taken from it.
+    complete = pulses if final else pulses - 1
+    first = widths[initial:max(complete - 9, 0):2]
+    second = widths[initial + 1:max(complete - 8, 0):2]
+    sync = numpy.flatnonzero((first > 0) & (second >= first * .75) & (second <= first * 1.25)) * 2 + initial
+    first = widths[sync]
+    for bit in range(2, 10):
+        width = widths[sync + bit]
+        if bit < 8:
+            keep = (width >= first * .75) & (width <= first * 1.25)
+        else:
+            keep = width >= first * 1.5
+        sync, first = sync[keep], first[keep]
+    sync_rates = (starts[sync + 9] - starts[sync]) / 10
+
+    # Synchronized stretches, each from a SYNC to the first BREAK or NARROW pulse at its
+    # bit rate.  As in ll_analyzer, a SYNC inside a stretch does not change the rate.
+    roots, rates, measured, stops = [], [], [], []
+    carried = carry.rate != None and count > 0 and initial == 1
+    position = 0
+    while position < pulses:
+        if carried:
+            # The byte the previous block stopped in front of
+            root, root_rate, carried, from_sync = 1, carry.rate, False, carry.measured
+        else:
+            index = numpy.searchsorted(sync, position)
+            if index == len(sync):
+                break
+            root, root_rate, from_sync = sync[index], sync_rates[index], True
+        stop = first_boundary(widths, initial, root + 1, root_rate)
+        roots.append(root)
+        rates.append(root_rate)
+        measured.append(from_sync)
+        stops.append(stop)
+        # A NARROW pulse may be the start bit of a SYNC at a higher bit rate
+        position = stop
+    roots = numpy.array(roots, dtype=numpy.int64)
+    rates = numpy.array(rates, dtype=numpy.float64)
+    measured = numpy.array(measured, dtype=bool)
+    stops = numpy.array(stops, dtype=numpy.int64)
+
+    # Byte start candidates: falling edges inside a synchronized stretch.  Stretch
+    # numbers and membership are running counts of marks at the roots and stops.
+    marks = numpy.zeros(pulses + 1, dtype=numpy.int8)
+    marks[roots] = 1
+    numbers = numpy.cumsum(marks[:-1], dtype=numpy.int32) - 1
+    marks[stops] -= 1
+    inside = numpy.cumsum(marks[:-1], dtype=numpy.int8) > 0
+    # Low pulses, pulse 0 included as a SYNC can start the capture
+    falling = numpy.arange(initial, pulses, 2)
+    falling = falling[inside[falling] & (widths[falling] > 0)]
+    stretch = numpy.asarray(numbers[falling], dtype=numpy.int64)
+    falling_times = starts[falling]
+    falling_rates = rates[stretch]
+
+    # Where the byte starting at each falling edge ends, as an index into falling: the
+    # first falling edge after its stop bits.  A byte holds at most four falling edges,
+    # so the next few are counted directly and only glitchy stretches are searched.
+    limits = falling_times + falling_rates * STOP_SAMPLE
+    padded = numpy.concatenate((falling_times, numpy.full(LOOKAHEAD, numpy.inf)))
+    passed = numpy.zeros(len(falling), dtype=numpy.int64)
+    for ahead in range(1, LOOKAHEAD + 1):
+        passed += padded[ahead:ahead + len(falling)] <= limits
+    following = numpy.arange(1, len(falling) + 1) + passed
+    far = numpy.flatnonzero(passed == LOOKAHEAD)
+    following[far] = numpy.searchsorted(falling_times, limits[far], 'right')
+    sentinel = len(falling)
+    valid = following < sentinel
+    valid[valid] = stretch[following[valid]] == stretch[valid]
+    jump = numpy.append(numpy.where(valid, following, sentinel), sentinel)
+
+    # Pointer doubling: after each round the chains from the roots are known twice as far
+    chain = numpy.searchsorted(falling, roots)
+    found = chain < sentinel
+    found[found] = falling[chain[found]] == roots[found]
+    chain, at_root = chain[found], measured[found]
+    is_byte = numpy.zeros(sentinel + 1, dtype=bool)
+    is_byte[chain] = True
+    is_root = numpy.zeros(sentinel + 1, dtype=bool)
+    is_root[chain] = at_root
+    while True:
+        reached = jump[chain]
+        reached = reached[reached != sentinel]
+        if not len(reached):
+            break
+        is_byte[reached] = True
+        chain = numpy.concatenate((chain, reached))
+        jump = jump[jump]
+    chain = numpy.flatnonzero(is_byte[:-1])
+    at_root = is_root[chain]
+    byte_pulses = falling[chain]
+    byte_starts = falling_times[chain]
+    byte_rates = falling_rates[chain]
+
+    # Stop in front of the last byte, the next block starts with it
+    cut = count
+    reference = float(rates[-1]) if len(roots) else carry.reference
+    next_carry = Carry(None, False, reference)
+    if not final:
+        if len(byte_pulses):
+            cut = max(byte_pulses[-1] - 1, 0)
+            next_carry = Carry(float(byte_rates[-1]), bool(at_root[-1]), reference)
+            byte_pulses, byte_starts, byte_rates, at_root = byte_pulses[:-1], byte_starts[:-1], byte_rates[:-1], at_root[:-1]
+        else:
+            # A SYNC takes ten pulses
+            cut = max(count - 10, 0)
+    cut_time = times[cut] if cut < count else numpy.inf
+
+    # Sample the middle of every bit.  At most FRAME_BITS - 1 edges follow the start of
+    # a byte within it.  Each is placed at the first sample after it and inverts every
+    # sample from there on, giving the twelve levels as one word, start bit lowest.
+    # crossed counts the edges within the byte.
+    padded = numpy.concatenate((times, numpy.full(FRAME_BITS - 1, numpy.inf)))
+    middle = byte_starts + byte_rates * .5
+    scale = 1 / byte_rates
+    levels = numpy.zeros(len(byte_pulses), dtype=numpy.int32)
+    crossed = numpy.zeros(len(byte_pulses), dtype=numpy.int64)
+    for edge in range(FRAME_BITS - 1):
+        placed = padded[byte_pulses + edge] - middle
+        placed *= scale
+        numpy.ceil(placed, out=placed)
+        numpy.clip(placed, 0, FRAME_BITS, out=placed)
+        placed = placed.astype(numpy.int32)
+        levels ^= ALL_BITS << placed
+        crossed += placed < FRAME_BITS
+    levels &= ALL_BITS
+    values = (levels >> 1) & 0xFF
+    parity_ok = PARITY[values] == (levels >> 9) & 1
+    frame_ok = levels & 0xC01 == 0xC00
+    byte_kinds = numpy.where(values == 0x55, SYNC_KIND, DATA_KIND)
+    byte_kinds = numpy.where(parity_ok, byte_kinds, PARITY_KIND)
+    byte_kinds = numpy.where(frame_ok, byte_kinds, FRAMING_KIND)
+    byte_frame_starts = numpy.where(at_root, byte_starts, byte_starts + byte_rates / 2)
+    byte_frame_ends = byte_starts + byte_rates * FRAME_BITS
+    byte_bauds = numpy.where(at_root & (byte_kinds == SYNC_KIND), 1 / byte_rates, numpy.nan)
+
+    # Pulses no byte covers.  A byte covers its pulses up to the one holding its last
+    # sample, marked +1 at the first and -1 after the last and summed up.
+    cover = numpy.zeros(pulses + 1, dtype=numpy.int8)
+    cover[byte_pulses] = 1
+    cover[byte_pulses + crossed + 1] -= 1
+    covered = numpy.cumsum(cover[:-1], dtype=numpy.int8) > 0
+    loose = numpy.flatnonzero(~covered & (widths > 0) & (starts < cut_time))
+    loose_widths = widths[loose]
+    # The stretch the pulse is in or follows, else the one before this block
+    follows = numpy.searchsorted(roots, loose, 'right')
+    reference = numpy.concatenate(([numpy.nan if carry.reference == None else carry.reference], rates))[follows]
+    with numpy.errstate(invalid='ignore'):
+        loose_kinds = numpy.where(numpy.isnan(reference) | (loose_widths > reference * BREAK_BITS), BREAK_KIND,
+                      numpy.where(loose_widths < reference * .75, NARROW_KIND, WRONG_BIT_KIND))
+    loose_kinds = numpy.where((loose & 1) == initial, loose_kinds, IDLE_KIND)
+    loose_values = numpy.where(loose_kinds == BREAK_KIND, 0x00, 0xFF)
+
+    # Both in time order
+    start = numpy.concatenate((byte_frame_starts, starts[loose]))
+    order = numpy.argsort(start, kind='stable')
+    end = numpy.concatenate((byte_frame_ends, ends[loose]))[order]
+    value = numpy.concatenate((values, loose_values))[order]
+    kind = numpy.concatenate((byte_kinds, loose_kinds))[order]
+    baud = numpy.concatenate((byte_bauds, numpy.full(len(loose), numpy.nan)))[order]
+    return start[order], end, value, kind, baud, int(cut), next_carry
+
+# Frames for a channel whose transition times come in chunks (arrays), decoded a block
+# at a time with NumPy when it is installed, edge by edge otherwise
+def iter_edge_frames(initial_state, chunks, begin_time=0.0, block=EDGE_BLOCK):
+    if numpy == None:
+        yield from decode_edges(initial_state, (time for chunk in chunks for time in chunk), begin_time)
+        return
+
+    pending = numpy.empty(0)
+    carry = NO_CARRY
+    count = 0
+    chunks = iter(chunks)
+    final = False
+    size = block
+    while not final:
+        # Fill a block, the last one is decoded to the end
+        while len(pending) < size:
+            chunk = next(chunks, None)
+            # Chunks may be arrays, which compare element by element
+            if chunk is None:
+                final = True
+                break
+            pending = numpy.concatenate((pending, numpy.asarray(chunk, dtype=numpy.float64)))
+        if not len(pending):
+            break
+
+        start, end, value, kind, baud, cut, carry = decode_edge_arrays(pending, initial_state, begin_time, carry, final)
+        for start_time, end_time, data, type, rate_baud in zip(start.tolist(), end.tolist(), value.tolist(), kind.tolist(), baud.tolist()):
+            count += 1
+            frame = {'count': count, 'data': bytes((data,))}
+            if rate_baud == rate_baud:
+                frame['command'] = '(Baud Rate: %g)' % rate_baud
+            yield AnalyzerFrame(EDGE_KINDS[type], start_time, end_time, frame)
+
+        # A block nothing could be decoded from (a long glitch burst after the byte it
+        # starts with, or too few edges for a SYNC) is decoded again with more edges
+        size = block if cut else 2 * len(pending)
+
+        # Carry on from the first edge not decoded, with the level before it
+        if cut < len(pending):
+            initial_state ^= cut & 1
+            begin_time = pending[cut]
+        pending = pending[cut:]
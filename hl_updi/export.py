@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+from array import array
+
+import offline
+
+#########################################################################################
+# Columnar export of decoded UPDI commands
+#
+# A session is a directory with one flat file per column, a side blob holding the data
+# bytes of every command, and columns.json describing them.  Each column file is a raw
+# array, so numpy.fromfile / numpy.memmap loads it without parsing.
+#########################################################################################
+
+# Column name, array typecode, numpy dtype
+COLUMNS = [
+    ('start_time',      'd', 'f8'),     # Frame start time
+    ('end_time',        'd', 'f8'),     # Frame end time
+    ('opcode',          'B', 'u1'),     # Index into OPCODES, or one of the frame kinds below
+    ('cs',              'B', 'u1'),     # CS register, NO_CS if none
+    ('address',         'I', 'u4'),     # Address (little endian as sent), NO_ADDRESS if none
+    ('data_length',     'I', 'u4'),     # Bytes of data in the payload blob
+    ('payload_offset',  'Q', 'u8'),     # Offset of the data in the payload blob
+    ('ack',             'B', 'u1'),     # ACK_NONE, ACK_OK or ACK_MISSING
+    ('element',         'I', 'u4'),     # Element number within a REPEAT, 0 if not repeating
+    ('count',           'Q', 'u8'),     # Stream bytes consumed up to the end of the frame
+]
+
+# Frames that are not an opcode
+KIND_IDLE = 0xF0
+KIND_BREAK = 0xF1
+KIND_UNKNOWN = 0xF2
+KIND_INVALID = 0xF3
+KIND_BLOCK = 0xF4
+KIND_POLL = 0xF5
+KIND_RESYNC = 0xF6     # A command cut short by Resync, the bytes received are its data
+
+KINDS = {
+    'IDLE'      : KIND_IDLE,
+    'BREAK'     : KIND_BREAK,
+    'UNKNOWN'   : KIND_UNKNOWN,
+    'RESYNC'    : KIND_RESYNC,
+}
+
+NO_CS = 0xFF
+NO_ADDRESS = 0xFFFFFFFF
+
+ACK_NONE = 0
+ACK_OK = 1
+ACK_MISSING = 2
+
+PAYLOAD = 'payload.bin'
+SCHEMA = 'columns.json'
+
+# Rows buffered before they are appended to the column files
+BATCH_SIZE = 65536
+
+class ColumnarWriter:
+
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.rows = 0
+        self.payload_size = 0
+        os.makedirs(path, exist_ok=True)
+        self.buffers = {name: array(typecode) for name, typecode, dtype in COLUMNS}
+        self.files = {name: open(os.path.join(path, '%s.%s' % (name, dtype)), 'wb') for name, typecode, dtype in COLUMNS}
+        self.payload = open(os.path.join(path, PAYLOAD), 'wb')
+        self.pending = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def row(self, start_time, end_time, opcode, cs, address, data, ack, element, count):
+        buffers = self.buffers
+        buffers['start_time'].append(float(start_time))
+        buffers['end_time'].append(float(end_time))
+        buffers['opcode'].append(opcode)
+        buffers['cs'].append(cs)
+        buffers['address'].append(address)
+        buffers['data_length'].append(len(data))
+        buffers['payload_offset'].append(self.payload_size + len(self.pending))
+        buffers['ack'].append(ack)
+        buffers['element'].append(element)
+        buffers['count'].append(count)
+        self.pending += data
+        self.rows += 1
+        if len(buffers['opcode']) >= self.batch_size:
+            self.flush()
+
+    # Append one frame produced by hla.  Command frames need lazy_frames so the raw
+    # decoded fields are still there.
+    def write(self, frame):
+        decoded = getattr(frame.data, 'decoded', None)
+        if decoded == None:
+            if 'elements' in frame.data:
+                # REPEAT block frame, the data stays in the stream at 'offset'
+                self.row(frame.start_time, frame.end_time, KIND_BLOCK, NO_CS,
+                         frame.data['pointer'] & NO_ADDRESS, b'', ACK_NONE, frame.data['elements'], int(frame.data['count'], 16))
+                return
+            if 'repeats' in frame.data:
+                # Collapsed polling run, element holds the number of repeats
+                self.row(frame.start_time, frame.end_time, KIND_POLL, NO_CS,
+                         NO_ADDRESS, b'', ACK_NONE, frame.data['repeats'], int(frame.data['count'], 16))
+                return
+            raise ValueError('Frame has no decoded fields, decode with lazy_frames=True')
+
+        code = decoded.opcode
+        if code == None:
+            kind = KINDS.get(decoded.command, KIND_INVALID)
+            self.row(frame.start_time, frame.end_time, kind, NO_CS, NO_ADDRESS, decoded.payload, ACK_NONE, 0, decoded.count)
+            return
+
+        if decoded.acked == None:
+            ack = ACK_NONE
+        else:
+            ack = ACK_OK if decoded.acked else ACK_MISSING
+        address = int.from_bytes(decoded.address, 'little') if code.address and not decoded.address_reserved else NO_ADDRESS
+        self.row(frame.start_time, frame.end_time, code.index, decoded.cs if code.register else NO_CS,
+                 address, decoded.data, ack, decoded.element, decoded.count)
+
+    def flush(self):
+        for name, buffer in self.buffers.items():
+            buffer.tofile(self.files[name])
+            del buffer[:]
+        self.payload.write(self.pending)
+        self.payload_size += len(self.pending)
+        self.pending = bytearray()
+
+    def close(self):
+        if self.payload.closed:
+            return
+        self.flush()
+        for file in self.files.values():
+            file.close()
+        self.payload.close()
+        with open(os.path.join(self.path, SCHEMA), 'w') as file:
+            json.dump({
+                'rows'      : self.rows,
+                'byteorder' : sys.byteorder,
+                'columns'   : [{'name': name, 'dtype': dtype} for name, typecode, dtype in COLUMNS],
+                'payload'   : PAYLOAD,
+            }, file, indent=1)
+
+# Decode byte records straight into a columnar session
+def export_records(records, path, batch_size=BATCH_SIZE, **settings):
+    settings['lazy_frames'] = True
+    with ColumnarWriter(path, batch_size) as writer:
+        for frame in offline.iter_decode(records, **settings):
+            writer.write(frame)
+    return writer.rows
+
+# Load a session: {column: array} plus the payload blob.  Uses numpy memory maps when available.
+def load(path):
+    with open(os.path.join(path, SCHEMA)) as file:
+        schema = json.load(file)
+    order = '<' if schema['byteorder'] == 'little' else '>'
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    columns = {}
+    for column in schema['columns']:
+        filename = os.path.join(path, '%s.%s' % (column['name'], column['dtype']))
+        if numpy != None:
+            columns[column['name']] = numpy.memmap(filename, dtype=order + column['dtype'], mode='r') if schema['rows'] else numpy.zeros(0, order + column['dtype'])
+        else:
+            typecode = [typecode for name, typecode, dtype in COLUMNS if name == column['name']][0]
+            values = array(typecode)
+            with open(filename, 'rb') as file:
+                values.frombytes(file.read())
+            if schema['byteorder'] != sys.byteorder:
+                values.byteswap()
+            columns[column['name']] = values
+
+    with open(os.path.join(path, schema['payload']), 'rb') as file:
+        payload = file.read()
+    return columns, payload
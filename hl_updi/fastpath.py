@@ -0,0 +1,145 @@
+import offline
+from opcodes import OPCODE_TABLE
+from updi import States, command_bytes
+
+# NumPy is optional, the same tables are applied with bytes.translate without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#########################################################################################
+# Offline fast path
+#
+# hla.decode dispatches every byte through the state handlers.  For a whole capture the
+# length of each command is known as soon as its opcode is: the bytes after the opcode
+# follow from the opcode's address/data/key sizes and ACK (command_bytes).  Here those
+# lengths are looked up for every position of the stream at once, then the stream is
+# walked one command at a time and each command is handed to hla as a complete span.
+#
+# Only a SYNC followed by a valid opcode, with the analyzer idle and no REPEAT pending,
+# takes the fast path.  Everything else (text bytes, invalid opcodes, REPEAT bursts, a
+# command cut off by the end of the capture) goes through hla.decode byte by byte, so
+# the frames are identical to a sequential decode.
+#########################################################################################
+
+SYNC = 0x55
+
+# Bytes after each opcode byte while no reserved size (-1) is carried over from an
+# earlier command, 0xFF for invalid opcodes
+def span_table():
+    table = bytearray(b'\xFF' * 256)
+    for byte, code in enumerate(OPCODE_TABLE):
+        if code != None:
+            table[byte] = command_bytes(code, code.address_count or 0, code.data_count or 0)
+    return bytes(table)
+
+SPAN_TABLE = span_table()
+
+# Command length for every position in the stream, as if a SYNC stood there
+def command_spans(stream):
+    if numpy != None:
+        data = numpy.frombuffer(stream, dtype=numpy.uint8)
+        spans = numpy.frombuffer(SPAN_TABLE, dtype=numpy.uint8)[numpy.roll(data, -1)]
+        return spans.tolist()
+    return stream[1:].translate(SPAN_TABLE) + b'\xFF'
+
+def iter_decode_fast(records, analyzer=None, **settings):
+    if analyzer == None:
+        analyzer = offline.create_analyzer(**settings)
+
+    # Statistics count bytes per state, resync checks every byte and bus timing times
+    # every byte, only the byte by byte decoder keeps them right
+    if analyzer.stats != None or analyzer.resync != None or analyzer.timing != None:
+        yield from offline.iter_decode(records, analyzer)
+        return
+
+    analyzer.load_tables()
+    records = records if isinstance(records, list) else list(records)
+    stream = bytes(record[-1] for record in records)
+    spans = command_spans(stream)
+    byte_frame = offline.byte_frame
+    decode = analyzer.decode
+    polling = analyzer.polling
+    length = len(stream)
+
+    index = 0
+    while index < length:
+        if analyzer.state != States.Start or analyzer.repeat_count > 0 or stream[index] != SYNC:
+            frames = decode(byte_frame(records[index]))
+            if frames:
+                yield from frames
+            index += 1
+            continue
+
+        code = OPCODE_TABLE[stream[index + 1]] if index + 1 < length else None
+        if code == None:
+            frames = decode(byte_frame(records[index]))
+            if frames:
+                yield from frames
+            index += 1
+            continue
+
+        # Sizes the opcode does not set carry over from the previous command
+        command = analyzer.command
+        address_count = code.address_count if code.address_count != None else command.address_count
+        data_count = code.data_count if code.data_count != None else command.data_count
+        if command.address_count == -1 or command.data_count == -1:
+            span = command_bytes(code, address_count, data_count)
+        else:
+            span = spans[index]
+        end = index + 2 + span
+        if end > length:
+            # Cut off by the end of the capture, leave the analyzer part way into it
+            frames = decode(byte_frame(records[index]))
+            if frames:
+                yield from frames
+            index += 1
+            continue
+
+        frames = complete_span(analyzer, code, stream, records, index, end, address_count, data_count)
+        index = end
+        if polling != None:
+            frames = polling.feed(frames)
+        if frames:
+            yield from frames
+
+    yield from analyzer.flush()
+
+# Do what capture_start, capture_opcode, capture_address, capture_data and capture_ack
+# would have done for the bytes [index, end), then complete the command
+def complete_span(analyzer, code, stream, records, index, end, address_count, data_count):
+    command = analyzer.command
+    analyzer.frames = []
+    analyzer.payload.extend(stream[index:end])
+    command.reset()
+    command.mnemonic += 'SYNC '
+    command.start_time = records[index][0]
+    command.last_opcode_byte = stream[index + 1]
+    command.opcode = code
+    command.address_count = address_count
+    command.data_count = data_count
+    if code.register:
+        command.cs = code.cs
+
+    if code.type != 'unknown':
+        if command.start_time == 0:
+            command.start_time = records[index + 2][0]
+        body = index + 2
+        if address_count > 0:
+            command.address.extend(stream[body:body + address_count])
+            body += address_count - 1
+            command.address_count = 0
+        if data_count > 0:
+            command.data.extend(stream[body:body + data_count])
+            command.data_count = 0
+    if code.ack:
+        command.acked = stream[end - 1] == 0x40
+
+    analyzer.state = States.Complete
+    analyzer.capture_complete(stream[end - 1], offline.byte_frame(records[end - 1]))
+    return analyzer.frames
+
+# Decode a whole capture through the fast path, returning every frame
+def decode_records_fast(records, **settings):
+    return list(iter_decode_fast(records, **settings))
@@ -0,0 +1,147 @@
+from collections import namedtuple
+from collections.abc import Mapping
+from textcache import BYTE_HEX, spaced_hex, packed_hex, quoted_text
+
+# Raw decoded fields of one UPDI frame.  Everything needed to build the
+# displayed strings later, without looking back at the analyzer state.
+Decoded = namedtuple('Decoded', [
+    'count',            # Stream bytes consumed up to the end of this frame
+    'payload',          # Raw stream bytes of this frame
+    'command',          # Mnemonic text, or the 'SYNC ' prefix for opcode frames
+    'pseudocode',       # Pseudocode text (text frames only)
+    'response',         # Response text (text frames only)
+    'opcode',           # Opcode from OPCODE_TABLE, None for IDLE/BREAK/UNKNOWN/INVALID
+    'cs',               # CS register number
+    'address',          # Address bytes, as received
+    'data',             # Data bytes, as received
+    'address_reserved', # Address size was RESERVED
+    'data_reserved',    # Data size was RESERVED
+    'acked',            # None if no ACK expected, else whether it was seen
+    'element',          # Element number within a REPEAT, 0 if not repeating
+    'registers',        # (names, values) register tables used to render CS values
+    'keys',             # KEY bytes -> key name for the selected device
+], defaults=('', '', None, None, b'', b'', False, False, None, 0, None, None))
+
+FRAME_KEYS = ('count', 'data', 'command', 'response', 'pseudocode')
+
+def hex_string(data, isSpace=False):
+    return spaced_hex(bytes(data)) if isSpace == True else packed_hex(bytes(data))
+
+def ascii_string(data):
+    return quoted_text(bytes(data))
+
+# Build the displayed strings of a frame
+def format_frame(decoded):
+    code = decoded.opcode
+    if code == None:
+        return {
+            'count' : '0x%04X' % decoded.count,
+            'data' : spaced_hex(decoded.payload),
+            'command' : decoded.command,
+            'response' : decoded.response,
+            'pseudocode' : decoded.pseudocode,
+        }
+
+    register_names, register_values = decoded.registers
+    cs = decoded.cs
+    mnemonic = decoded.command + code.name + ' '
+    repeat_text = '#%d ' % decoded.element if decoded.element > 0 else ''
+    data = packed_hex(decoded.data) if not decoded.data_reserved else 'RESERVED'
+    ascii_data = quoted_text(decoded.data) if not decoded.data_reserved else 'RESERVED'
+    address = packed_hex(decoded.address) if not decoded.address_reserved else 'RESERVED'
+    pseudocode = ''
+    if decoded.acked == None:
+        response = ''
+    else:
+        response = ' (ACK)' if decoded.acked else ' (MISSING ACK)'
+
+    # Matched to a definition
+    if code.type == 'get':
+        # Get
+        if code.register:
+            # Get CS
+            mnemonic += BYTE_HEX[cs]
+            response = register_values[cs][decoded.data[0]] + response
+            pseudocode = 'Get %s' % register_names[cs]
+        elif code.key:
+            mnemonic += 'SIB == %s' % ascii_data
+            pseudocode = 'Get SIB'
+            response = data + response
+        elif code.address and code.data:
+            # Get *(address), Response in Data
+            mnemonic += '%s' % address
+            pseudocode = 'Get *(%s)' % address
+            response = data + response
+        elif code.data:
+            # Get from current pointer, response in data
+            mnemonic += data
+            pseudocode = 'Get *(ptr)'
+            response = data + response
+    elif code.type == 'ptr':
+        # Set Pointer
+        mnemonic += address
+        pseudocode = 'Set pointer = %s' % address
+    elif code.type == 'set':
+        if code.register:
+            # Set Register with Data
+            mnemonic += '%s = %s' % (BYTE_HEX[cs], BYTE_HEX[decoded.data[0]])
+            pseudocode = 'Set %s' % register_values[cs][decoded.data[0]]
+        elif code.key:
+            mnemonic += ascii_data
+            pseudocode = 'Set KEY = %s' % ascii_data
+            if decoded.keys and decoded.data in decoded.keys:
+                pseudocode += ' (%s)' % decoded.keys[decoded.data]
+        elif code.address and code.data:
+            # Write at Address from Data
+            mnemonic += '%s = %s' % (address, data)
+            pseudocode = 'Write *(%s) = %s' % (address, data)
+        else:
+            # Set Data to pointer address
+            mnemonic += data
+            pseudocode = 'Write *(pointer++) = %s' % data
+    elif code.type == 'repeat':
+        # Repeat Command
+        mnemonic += 'x %s' % data
+        pseudocode = 'Repeat next command %d times' % (int.from_bytes(decoded.data, 'big') + 1)
+    else:
+        # Unknown Command
+        mnemonic += 'UNKNOWN COMMAND'
+        pseudocode = 'Unknown Command'
+
+    return {
+        'count' : '0x%04X' % decoded.count,
+        'data' : spaced_hex(decoded.payload),
+        'command' : mnemonic,
+        'response' : response,
+        'pseudocode' : repeat_text + pseudocode,
+    }
+
+# Frame data that keeps the raw decoded fields and only builds the
+# displayed strings the first time one of them is read
+class FrameData(Mapping):
+
+    __slots__ = ('decoded', 'formatted')
+
+    def __init__(self, decoded):
+        self.decoded = decoded
+        self.formatted = None
+
+    def fields(self):
+        if self.formatted == None:
+            self.formatted = format_frame(self.decoded)
+        return self.formatted
+
+    def __getitem__(self, key):
+        return self.fields()[key]
+
+    def __iter__(self):
+        return iter(FRAME_KEYS)
+
+    def __len__(self):
+        return len(FRAME_KEYS)
+
+    def __contains__(self, key):
+        return key in FRAME_KEYS
+
+    def __repr__(self):
+        return repr(self.fields())
@@ -0,0 +1,164 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from heapq import merge
+
+from registers import REGISTER_DEFINITIONS
+
+#########################################################################################
+# Session index
+#
+# Built alongside decoding (hla.build_index) so long sessions can be queried without
+# scrolling frames.  Every completed command, and every IDLE/BREAK/UNKNOWN/INVALID
+# event, is one row.  Rows are appended in time order, so row numbers double as a time
+# index; posting lists of row numbers per opcode and per CS register, and address
+# buckets for memory accesses, are therefore sorted as well and searched with bisect.
+#########################################################################################
+
+# Memory access buckets, an access spanning several buckets is listed in each of them
+BUCKET_BITS = 8
+
+ACCESS_NONE = 0
+ACCESS_READ = 1
+ACCESS_WRITE = 2
+
+Row = namedtuple('Row', ['row', 'start_time', 'end_time', 'name', 'cs', 'address', 'length', 'access', 'count'])
+
+class SessionIndex:
+
+    def __init__(self):
+        self.start_times = array('d')
+        self.end_times = array('d')     # Nondecreasing, the time key
+        self.names = []                 # Opcode or event name, interned by the decoder
+        self.cs = array('b')            # -1 when not a CS register access
+        self.addresses = array('q')     # -1 when there is no address
+        self.lengths = array('L')
+        self.accesses = array('B')
+        self.counts = array('Q')
+        self.by_name = {}               # Name -> row numbers
+        self.by_register = {}           # CS -> row numbers
+        self.buckets = {ACCESS_READ : {}, ACCESS_WRITE : {}}    # Bucket -> row numbers
+
+    def __len__(self):
+        return len(self.end_times)
+
+    def append(self, start_time, end_time, name, cs=-1, address=-1, length=0, access=ACCESS_NONE, count=0):
+        row = len(self.end_times)
+        self.start_times.append(float(start_time))
+        self.end_times.append(float(end_time))
+        self.names.append(name)
+        self.cs.append(cs)
+        self.addresses.append(address)
+        self.lengths.append(length)
+        self.accesses.append(access)
+        self.counts.append(count)
+
+        postings = self.by_name.get(name)
+        if postings == None:
+            postings = self.by_name[name] = array('L')
+        postings.append(row)
+        if cs >= 0:
+            postings = self.by_register.get(cs)
+            if postings == None:
+                postings = self.by_register[cs] = array('L')
+            postings.append(row)
+        if access != ACCESS_NONE and address >= 0:
+            buckets = self.buckets[access]
+            for bucket in range(address >> BUCKET_BITS, ((address + max(length, 1) - 1) >> BUCKET_BITS) + 1):
+                postings = buckets.get(bucket)
+                if postings == None:
+                    postings = buckets[bucket] = array('L')
+                postings.append(row)
+        return row
+
+    # Drop the rows from row on, when the decoder goes back to an earlier byte
+    def truncate(self, row):
+        if row >= len(self.end_times):
+            return
+        for column in (self.start_times, self.end_times, self.names, self.cs, self.addresses, self.lengths, self.accesses, self.counts):
+            del column[row:]
+        for lists in (self.by_name, self.by_register, self.buckets[ACCESS_READ], self.buckets[ACCESS_WRITE]):
+            for key in list(lists):
+                postings = lists[key]
+                del postings[bisect_left(postings, row):]
+                if not postings:
+                    del lists[key]
+
+    # Index one decoded command, with the UPDI pointer as it was before the command
+    def add_command(self, start_time, end_time, code, cs, pointer, address, data, address_reserved, count):
+        name = code.name
+        access = ACCESS_NONE
+        location = -1
+        if name in ('ST *(ptr++)', 'ST *(ptr)', 'LD *(ptr++)', 'LD *(ptr)'):
+            access = ACCESS_WRITE if code.type == 'set' else ACCESS_READ
+            location = pointer if pointer != None else -1
+        elif code.address and not address_reserved:
+            location = int.from_bytes(address, 'little')
+            if name in ('STS', 'LDS'):
+                access = ACCESS_WRITE if code.type == 'set' else ACCESS_READ
+        return self.append(start_time, end_time, name, cs if code.register else -1, location, len(data), access, count)
+
+    def add_event(self, start_time, end_time, name, count):
+        return self.append(start_time, end_time, name, count=count)
+
+    def row(self, row):
+        return Row(row, self.start_times[row], self.end_times[row], self.names[row], self.cs[row],
+                   self.addresses[row], self.lengths[row], self.accesses[row], self.counts[row])
+
+    # Rows [first, last) that end within [start_time, end_time]
+    def span(self, start_time=None, end_time=None):
+        first = 0 if start_time == None else bisect_left(self.end_times, start_time)
+        last = len(self.end_times) if end_time == None else bisect_right(self.end_times, end_time)
+        return first, last
+
+    # Row numbers from a posting list that fall within a time span
+    def select(self, postings, start_time=None, end_time=None):
+        first, last = self.span(start_time, end_time)
+        return postings[bisect_left(postings, first):bisect_left(postings, last)]
+
+    # Commands or events by name ('LDCS', 'KEY', 'BREAK', ...)
+    def named(self, name, start_time=None, end_time=None):
+        return [self.row(row) for row in self.select(self.by_name.get(name, ()), start_time, end_time)]
+
+    # LDCS/STCS of a CS register, by number or name ('ASI_SYS_STATUS')
+    def register(self, cs, start_time=None, end_time=None, name=None):
+        cs = register_number(cs)
+        rows = [self.row(row) for row in self.select(self.by_register.get(cs, ()), start_time, end_time)]
+        return [row for row in rows if row.name == name] if name != None else rows
+
+    # First row named name ending at or after time
+    def first_after(self, name, time=None):
+        postings = self.by_name.get(name, ())
+        first = 0 if time == None else bisect_left(self.end_times, time)
+        position = bisect_left(postings, first)
+        return self.row(postings[position]) if position < len(postings) else None
+
+    # Memory accesses overlapping [low, high]
+    def accesses_to(self, access, low, high, start_time=None, end_time=None):
+        buckets = self.buckets[access]
+        lists = [self.select(buckets[bucket], start_time, end_time)
+                 for bucket in range(low >> BUCKET_BITS, (high >> BUCKET_BITS) + 1) if bucket in buckets]
+        rows = []
+        previous = -1
+        for row in merge(*lists):
+            if row == previous:
+                continue
+            previous = row
+            address = self.addresses[row]
+            if address <= high and address + max(self.lengths[row], 1) - 1 >= low:
+                rows.append(self.row(row))
+        return rows
+
+    def writes(self, low, high, start_time=None, end_time=None):
+        return self.accesses_to(ACCESS_WRITE, low, high, start_time, end_time)
+
+    def reads(self, low, high, start_time=None, end_time=None):
+        return self.accesses_to(ACCESS_READ, low, high, start_time, end_time)
+
+def register_number(cs):
+    if isinstance(cs, int):
+        return cs
+    for number, register in REGISTER_DEFINITIONS.items():
+        if register.get('name') == cs:
+            return number
+    raise KeyError('No CS register %r' % cs)
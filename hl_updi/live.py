@@ -0,0 +1,323 @@
+import os
+import csv
+import sys
+import stat
+import time
+import asyncio
+import argparse
+
+import offline
+from timing import StreamingHistogram
+
+#########################################################################################
+# Live decoding
+#
+# For soak tests, decoded commands are published as the bytes arrive instead of after
+# the capture stops.  Byte records come in as CSV lines (the formats read_records
+# takes) from a growing file, a pipe or a local socket standing in for a streaming
+# capture source, and go through three stages joined by bounded queues:
+#
+#   - the reader parses whatever has arrived into records, in batches of at most
+#     batch_size, and queues them for the decoder
+#   - the decoder takes a batch (waiting up to linger for more to fill it), runs it
+#     through hla and hands the frames to every subscriber
+#   - each subscriber reads frames from its own queue
+#
+# A full queue makes the stage in front of it wait.  A slow subscriber holds up the
+# decoder, the decoder stops taking batches, and the reader stops reading, which
+# leaves the data in the file, pipe or socket buffer: memory is bounded whatever the
+# input rate.  A subscriber that would rather lose frames than hold up the decoder
+# (a display) subscribes with drop=True.  Latency is the time from a batch being read
+# to its frames being published, kept in a StreamingHistogram.
+#
+# Queues and subscriptions belong to the running event loop, so LiveDecoder is created
+# and subscribed to from inside it.
+#########################################################################################
+
+# Records per batch
+BATCH_SIZE = 256
+
+# Longest wait for a batch to fill before decoding it anyway (seconds)
+LINGER = 0.0
+
+# Batches queued between the reader and the decoder
+QUEUE_BATCHES = 64
+
+# Batches of frames queued for each subscriber
+SUBSCRIBER_BATCHES = 64
+
+# Bytes read from the source at a time
+READ_SIZE = 1 << 16
+
+# How often a file that stopped growing is checked again (seconds)
+POLL_INTERVAL = 0.01
+
+class Subscription:
+
+    def __init__(self, size=SUBSCRIBER_BATCHES, drop=False):
+        self.queue = asyncio.Queue(size)
+        self.drop = drop
+        self.dropped = 0            # Frames lost to a full queue, with drop
+
+    async def put(self, frames):
+        if not self.drop:
+            await self.queue.put(frames)
+            return
+        try:
+            self.queue.put_nowait(frames)
+        except asyncio.QueueFull:
+            self.dropped += len(frames)
+
+    # End of the stream, always delivered.  With drop it takes the place of the oldest
+    # batch rather than wait for a reader that may never come.
+    async def close(self):
+        if self.drop:
+            while self.queue.full():
+                self.dropped += len(self.queue.get_nowait())
+            self.queue.put_nowait(None)
+        else:
+            await self.queue.put(None)
+
+    # Frames a batch at a time, until the stream ends
+    async def batches(self):
+        while True:
+            frames = await self.queue.get()
+            if frames == None:
+                return
+            yield frames
+
+    def __aiter__(self):
+        return self.frames()
+
+    async def frames(self):
+        async for frames in self.batches():
+            for frame in frames:
+                yield frame
+
+class LiveDecoder:
+
+    def __init__(self, analyzer=None, batch_size=BATCH_SIZE, linger=LINGER, queue_batches=QUEUE_BATCHES, **settings):
+        self.analyzer = analyzer if analyzer != None else offline.create_analyzer(**settings)
+        self.batch_size = max(batch_size, 1)
+        self.linger = linger
+        self.queue = asyncio.Queue(queue_batches)
+        self.subscribers = []
+        self.latency = StreamingHistogram()
+        self.records = 0
+        self.frames = 0
+        self.batches = 0
+        self.deepest = 0            # Most batches ever waiting for the decoder
+
+    def subscribe(self, size=SUBSCRIBER_BATCHES, drop=False):
+        subscription = Subscription(size, drop)
+        self.subscribers.append(subscription)
+        return subscription
+
+    # Decode chunks of CSV text (an async iterator of bytes) until they end
+    async def run(self, chunks):
+        await asyncio.gather(self.read(chunks), self.decode())
+
+    async def read(self, chunks):
+        parser = offline.RecordParser()
+        partial = b''
+        try:
+            async for chunk in chunks:
+                lines = (partial + chunk).split(b'\n')
+                partial = lines.pop()
+                await self.queue_records(parser, lines)
+            await self.queue_records(parser, [partial])
+        finally:
+            await self.queue.put(None)
+
+    async def queue_records(self, parser, lines):
+        batch = []
+        for row in csv.reader(line.decode('latin-1') for line in lines):
+            record = parser.parse(row)
+            if record != None:
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    await self.queue_batch(batch)
+                    batch = []
+        if batch:
+            await self.queue_batch(batch)
+
+    async def queue_batch(self, batch):
+        await self.queue.put((time.perf_counter(), batch))
+        self.deepest = max(self.deepest, self.queue.qsize())
+
+    async def decode(self):
+        analyzer = self.analyzer
+        byte_frame = offline.byte_frame
+        ended = False
+        while not ended:
+            batch = await self.queue.get()
+            if batch == None:
+                break
+            read_time, records = batch
+            if self.linger > 0 and len(records) < self.batch_size:
+                records, ended = await self.fill(records)
+
+            frames = []
+            for record in records:
+                output = analyzer.decode(byte_frame(record))
+                if output:
+                    frames.extend(output)
+            self.records += len(records)
+            self.batches += 1
+            await self.publish(frames)
+            self.latency.add(time.perf_counter() - read_time)
+
+        # Frames held back by polling collapse or resync
+        await self.publish(analyzer.flush())
+        for subscriber in self.subscribers:
+            await subscriber.close()
+
+    # Take more batches for up to linger, the stream may end meanwhile
+    async def fill(self, records):
+        records = list(records)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.linger
+        while len(records) < self.batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch = await asyncio.wait_for(self.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if batch == None:
+                return records, True
+            records.extend(batch[1])
+        return records, False
+
+    async def publish(self, frames):
+        if not frames:
+            return
+        self.frames += len(frames)
+        for subscriber in self.subscribers:
+            await subscriber.put(frames)
+
+    def as_dict(self):
+        return {
+            'records'   : self.records,
+            'frames'    : self.frames,
+            'batches'   : self.batches,
+            'deepest'   : self.deepest,
+            'dropped'   : sum(subscriber.dropped for subscriber in self.subscribers),
+            'latency'   : self.latency.as_dict(),
+        }
+
+#########################################################################################
+# Sources, each an async iterator of chunks of CSV text
+#########################################################################################
+
+# A file that is still being written.  With follow, the end of the file is waited at
+# for more, until cancelled.
+async def file_chunks(path, follow=True, poll_interval=POLL_INTERVAL, size=READ_SIZE):
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(size)
+            if chunk:
+                yield chunk
+            elif follow:
+                await asyncio.sleep(poll_interval)
+            else:
+                return
+
+async def stream_chunks(reader, size=READ_SIZE):
+    while True:
+        chunk = await reader.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+# A pipe, standard input by default.  A regular file redirected to it is read to its end.
+async def pipe_chunks(pipe=None, size=READ_SIZE):
+    pipe = pipe if pipe != None else sys.stdin.buffer
+    if stat.S_ISREG(os.fstat(pipe.fileno()).st_mode):
+        while True:
+            chunk = pipe.read(size)
+            if not chunk:
+                return
+            yield chunk
+            await asyncio.sleep(0)
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    async for chunk in stream_chunks(reader, size):
+        yield chunk
+
+# A local socket: a Unix socket path, or host:port
+async def socket_chunks(address, size=READ_SIZE):
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        reader, writer = await asyncio.open_connection(host, int(port))
+    else:
+        reader, writer = await asyncio.open_unix_connection(address)
+    try:
+        async for chunk in stream_chunks(reader, size):
+            yield chunk
+    finally:
+        writer.close()
+
+# Frames as they are decoded from a source
+async def iter_decode_live(chunks, analyzer=None, batch_size=BATCH_SIZE, linger=LINGER, **settings):
+    decoder = LiveDecoder(analyzer, batch_size, linger, **settings)
+    subscription = decoder.subscribe()
+    task = asyncio.ensure_future(decoder.run(chunks))
+    try:
+        async for frame in subscription:
+            yield frame
+        await task
+    finally:
+        task.cancel()
+
+async def tail(source, args, settings):
+    decoder = LiveDecoder(batch_size=args.batch, linger=args.linger / 1000, queue_batches=args.queue, **settings)
+    subscription = decoder.subscribe(args.queue)
+    task = asyncio.ensure_future(decoder.run(source))
+    writer = csv.writer(sys.stdout, delimiter='\t', lineterminator='\n')
+    writer.writerow(['start_time', 'end_time', 'count', 'data', 'command', 'response', 'pseudocode'])
+    try:
+        async for frames in subscription.batches():
+            for frame in frames:
+                writer.writerow([frame.start_time, frame.end_time, frame.data['count'], frame.data['data'],
+                                 frame.data['command'], frame.data['response'], frame.data['pseudocode']])
+            sys.stdout.flush()
+        await task
+    finally:
+        task.cancel()
+        stats = decoder.as_dict()
+        latency = stats['latency']
+        print('%d records, %d frames in %d batches, queue depth up to %d, latency p50 %.3f ms p99 %.3f ms max %.3f ms' % (
+            stats['records'], stats['frames'], stats['batches'], stats['deepest'],
+            (latency['p50'] or 0) * 1000, (latency['p99'] or 0) * 1000, (latency['max'] or 0) * 1000), file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Decode UPDI byte records as they arrive')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help='CSV file of byte records that is still being written')
+    source.add_argument('--pipe', action='store_true', help='Read byte records from standard input')
+    source.add_argument('--socket', help='Read byte records from a local socket: a Unix socket path or host:port')
+    parser.add_argument('--no-follow', action='store_true', help='Stop at the end of --file instead of waiting for more')
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE, help='Records decoded per batch (default %d)' % BATCH_SIZE)
+    parser.add_argument('--linger', type=float, default=LINGER * 1000, help='Milliseconds to wait for a batch to fill (default 0)')
+    parser.add_argument('--queue', type=int, default=QUEUE_BATCHES, help='Batches queued between stages (default %d)' % QUEUE_BATCHES)
+    parser.add_argument('--unknown-bits', action='store_true', help='Show unknown register bits')
+    parser.add_argument('--collapse', action='store_true', help='Collapse polling loops into one frame per run')
+    args = parser.parse_args(argv)
+    settings = {'ShowUnknownBits': 'Yes' if args.unknown_bits else 'No', 'PollingFrames': 'Collapse' if args.collapse else 'Each'}
+
+    if args.file:
+        chunks = file_chunks(args.file, follow=not args.no_follow)
+    elif args.pipe:
+        chunks = pipe_chunks()
+    else:
+        chunks = socket_chunks(args.socket)
+    try:
+        asyncio.run(tail(chunks, args, settings))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+from profiles import DEFAULT_DEVICE, profile
+
+# Image pages, large enough that a programming session touches few of them
+PAGE_SIZE = 256
+
+# Memory map of the default part, when none is given
+def default_memory_map():
+    return profile(DEFAULT_DEVICE).memory_map
+
+def region(address, memory_map=None):
+    for name, start, end in memory_map if memory_map != None else default_memory_map():
+        if start <= address <= end:
+            return (name, start, end)
+    return None
+
+#########################################################################################
+# Target memory image
+#########################################################################################
+
+# Sparse image of the target's data space, built up from decoded UPDI traffic
+class MemoryImage:
+
+    def __init__(self, memory_map=None):
+        self.memory_map = memory_map if memory_map != None else default_memory_map()
+        self.pages = {}         # Page number -> contents
+        self.written = {}       # Page number -> 1 for each byte stored by the debugger
+        self.known = {}         # Page number -> 1 for each byte stored or read back
+        self.accessed = set()   # Addresses accessed through LDS/STS
+        self.writes = 0
+        self.reads = 0
+
+    def page(self, number):
+        if number not in self.pages:
+            self.pages[number] = bytearray(b'\xFF' * PAGE_SIZE)
+            self.written[number] = bytearray(PAGE_SIZE)
+            self.known[number] = bytearray(PAGE_SIZE)
+        return self.pages[number]
+
+    def store(self, address, data, written):
+        for offset, value in enumerate(data):
+            number, index = divmod(address + offset, PAGE_SIZE)
+            self.page(number)[index] = value
+            self.known[number][index] = 1
+            if written:
+                self.written[number][index] = 1
+
+    def write(self, address, data):
+        self.writes += 1
+        self.store(address, data, True)
+
+    # Data read back from the target is also what the target holds
+    def read(self, address, data):
+        self.reads += 1
+        self.store(address, data, False)
+
+    # Apply one decoded command, with the UPDI pointer as it was before the command
+    def apply(self, code, pointer, address, data, address_reserved=False):
+        name = code.name
+        if name in ('ST *(ptr++)', 'ST *(ptr)'):
+            if pointer != None and data:
+                self.write(pointer, data)
+        elif name in ('LD *(ptr++)', 'LD *(ptr)'):
+            if pointer != None and data:
+                self.read(pointer, data)
+        elif name in ('STS', 'LDS') and not address_reserved:
+            # The decoder's data for LDS/STS starts with the last address byte, so only
+            # the access itself is recorded, not its contents
+            self.accessed.add(int.from_bytes(address, 'little'))
+
+    def get(self, address):
+        number, index = divmod(address, PAGE_SIZE)
+        if number in self.pages and self.known[number][index]:
+            return self.pages[number][index]
+        return None
+
+    # Contiguous (address, bytes) runs of the image, in address order
+    def runs(self, start=0, end=None, written_only=True):
+        masks = self.written if written_only else self.known
+        run_start = None
+        run = bytearray()
+        for number in sorted(self.pages):
+            page = self.pages[number]
+            mask = masks[number]
+            base = number * PAGE_SIZE
+            for index in range(PAGE_SIZE):
+                address = base + index
+                if mask[index] and address >= start and (end == None or address <= end):
+                    if run_start != None and run_start + len(run) == address:
+                        run.append(page[index])
+                        continue
+                    if run_start != None:
+                        yield run_start, bytes(run)
+                    run_start = address
+                    run = bytearray((page[index],))
+        if run_start != None:
+            yield run_start, bytes(run)
+
+    def region_bounds(self, name):
+        for region_name, start, end in self.memory_map:
+            if region_name == name:
+                return start, end
+        raise KeyError('No memory region %r' % name)
+
+    # Intel HEX of the stored bytes.  With a region name, addresses are relative to its start.
+    def to_hex(self, region=None, written_only=True):
+        start, end, base = 0, None, 0
+        if region != None:
+            start, end = self.region_bounds(region)
+            base = start
+        lines = []
+        upper = 0
+        for address, data in self.runs(start, end, written_only):
+            address -= base
+            for offset in range(0, len(data), 16):
+                chunk = data[offset:offset + 16]
+                location = address + offset
+                if location >> 16 != upper:
+                    upper = location >> 16
+                    lines.append(hex_record(0, 0x04, upper.to_bytes(2, 'big')))
+                lines.append(hex_record(location & 0xFFFF, 0x00, chunk))
+        lines.append(hex_record(0, 0x01, b''))
+        return '\n'.join(lines) + '\n'
+
+    # Flat binary of a region (or the given range), unknown bytes filled with 0xFF
+    def to_binary(self, region=None, start=None, end=None, written_only=True):
+        if region != None:
+            start, end = self.region_bounds(region)
+        if start == None or end == None:
+            addresses = [address for address, data in self.runs(written_only=written_only) for address in (address, address + len(data) - 1)]
+            if not addresses:
+                return b''
+            start = min(addresses) if start == None else start
+            end = max(addresses) if end == None else end
+        image = bytearray(b'\xFF' * (end - start + 1))
+        for address, data in self.runs(start, end, written_only):
+            image[address - start:address - start + len(data)] = data
+        return bytes(image)
+
+def hex_record(address, record_type, data):
+    record = bytes((len(data), (address >> 8) & 0xFF, address & 0xFF, record_type)) + bytes(data)
+    checksum = (-sum(record)) & 0xFF
+    return ':' + record.hex().upper() + '%02X' % checksum
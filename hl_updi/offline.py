@@ -0,0 +1,230 @@
+import sys
+import csv
+import argparse
+
+#########################################################################################
+# Stand-in for saleae.analyzers, used when running outside of Logic 2
+#########################################################################################
+
+class HighLevelAnalyzer:
+    pass
+
+class AnalyzerFrame:
+
+    def __init__(self, type, start_time, end_time, data=None):
+        self.type = type
+        self.start_time = start_time
+        self.end_time = end_time
+        self.data = data if data != None else {}
+
+    def __repr__(self):
+        return 'AnalyzerFrame(%r, %r, %r, %r)' % (self.type, self.start_time, self.end_time, self.data)
+
+class ChoicesSetting:
+
+    def __init__(self, choices, label=''):
+        self.choices = list(choices)
+        self.label = label
+        self.default = self.choices[0] if self.choices else None
+
+class NumberSetting:
+
+    def __init__(self, label='', min_value=None, max_value=None):
+        self.label = label
+        self.min_value = min_value
+        self.max_value = max_value
+        self.default = min_value if min_value != None else 0
+
+class StringSetting:
+
+    def __init__(self, label=''):
+        self.label = label
+        self.default = ''
+
+SETTINGS = (ChoicesSetting, NumberSetting, StringSetting)
+
+def install():
+    # Prefer the real API if it is available
+    try:
+        import saleae.analyzers
+        return saleae.analyzers
+    except ImportError:
+        pass
+
+    import types
+    package = types.ModuleType('saleae')
+    package.__path__ = []
+    module = types.ModuleType('saleae.analyzers')
+    for name in ('HighLevelAnalyzer', 'AnalyzerFrame', 'ChoicesSetting', 'NumberSetting', 'StringSetting'):
+        setattr(module, name, globals()[name])
+    package.analyzers = module
+    sys.modules['saleae'] = package
+    sys.modules['saleae.analyzers'] = module
+    return module
+
+analyzers = install()
+
+import updi
+
+#########################################################################################
+# Batch decoding
+#########################################################################################
+
+# Create an analyzer the way Logic 2 does: settings are assigned before __init__ runs
+def create_analyzer(**settings):
+    analyzer = updi.hla.__new__(updi.hla)
+    for name in dir(updi.hla):
+        setting = getattr(updi.hla, name)
+        if name in settings:
+            setattr(analyzer, name, settings[name])
+        elif isinstance(setting, SETTINGS):
+            setattr(analyzer, name, setting.default)
+    analyzer.__init__()
+    return analyzer
+
+# Byte records are (timestamp, byte) or (start_time, end_time, byte)
+def byte_frame(record):
+    if len(record) == 2:
+        start_time = end_time = record[0]
+        byte = record[1]
+    else:
+        start_time, end_time, byte = record[0], record[1], record[2]
+    return analyzers.AnalyzerFrame('SYNC' if byte == 0x55 else 'DATA', start_time, end_time, {'data': bytes((byte,))})
+
+# Decode records one at a time, yielding frames as hla produces them
+def iter_decode(records, analyzer=None, **settings):
+    return iter_decode_frames((byte_frame(record) for record in records), analyzer, **settings)
+
+# Decode low level analyzer frames (SYNC, DATA, IDLE, BREAK, ...) as Logic 2 passes them to hla
+def iter_decode_frames(input_frames, analyzer=None, **settings):
+    if analyzer == None:
+        analyzer = create_analyzer(**settings)
+    for frame in input_frames:
+        frames = analyzer.decode(frame)
+        if frames:
+            yield from frames
+    yield from analyzer.flush()
+
+    # Decoding finished
+    if analyzer.stats != None:
+        analyzer.dump_stats(sys.stderr)
+    if analyzer.timing != None:
+        analyzer.timing.dump(sys.stderr)
+
+# Decode a whole capture, returning every frame
+def decode_records(records, **settings):
+    return list(iter_decode(records, **settings))
+
+#########################################################################################
+# Record files
+#########################################################################################
+
+# Byte records from CSV rows.  Either plain "timestamp,byte" rows, or a Logic 2 data
+# table export of the low level analyzer with start_time, duration and data columns,
+# told apart by the first row.
+class RecordParser:
+
+    def __init__(self):
+        self.columns = None
+
+    # The record in a row, None for headers, comments and rows without data
+    def parse(self, row):
+        if not row or row[0].startswith('#'):
+            return None
+        if self.columns == None:
+            header = [column.strip().lower() for column in row]
+            if 'start_time' in header and 'data' in header:
+                self.columns = header
+                return None
+            self.columns = []
+        if self.columns:
+            item = dict(zip(self.columns, row))
+            if not item['data']:
+                return None
+            start_time = float(item['start_time'])
+            end_time = start_time + float(item['duration']) if 'duration' in item and item['duration'] else start_time
+            return (start_time, end_time, int(item['data'], 0))
+        return (float(row[0]), int(row[1], 0))
+
+# Read byte records from a CSV file
+def read_records(path):
+    with open(path, newline='') as file:
+        parser = RecordParser()
+        for row in csv.reader(file):
+            record = parser.parse(row)
+            if record != None:
+                yield record
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Decode UPDI byte records without Logic 2')
+    parser.add_argument('records', help='CSV file of byte records, or the UPDI channel of a Logic 2 capture exported as binary (.bin)')
+    parser.add_argument('--unknown-bits', action='store_true', help='Show unknown register bits')
+    parser.add_argument('--jobs', type=int, default=1, help='Decode in this many processes')
+    parser.add_argument('--stats', action='store_true', help='Print decoder statistics to stderr when done')
+    parser.add_argument('--timing', action='store_true', help='Print bus timing and throughput to stderr when done')
+    parser.add_argument('--hex', help='Write the reconstructed memory image as Intel HEX')
+    parser.add_argument('--bin', help='Write the reconstructed memory image as a flat binary')
+    parser.add_argument('--region', default='FLASH', help='Memory region to export (default FLASH)')
+    parser.add_argument('--fast', action='store_true', help='Decode a command at a time instead of a byte at a time')
+    parser.add_argument('--columns', help='Also write the decoded commands to this columnar session directory')
+    args = parser.parse_args(argv)
+    settings = {'ShowUnknownBits': 'Yes' if args.unknown_bits else 'No', 'Statistics': 'On' if args.stats else 'Off'}
+    analyzer = None
+
+    import capture
+    try:
+        capture_file = capture.is_capture_file(args.records)
+    except capture.CaptureError as error:
+        parser.error(str(error))
+    if capture_file and (args.jobs > 1 or args.fast):
+        parser.error('--jobs and --fast need a CSV of byte records')
+    if args.timing and args.jobs > 1:
+        parser.error('--timing needs a single process decode')
+    if args.stats and args.jobs > 1:
+        parser.error('--stats needs a single process decode')
+    if (args.hex or args.bin) and args.jobs > 1:
+        parser.error('--hex and --bin need a single process decode')
+    if args.columns and args.jobs > 1:
+        parser.error('--columns needs a single process decode')
+
+    if args.jobs > 1:
+        import parallel
+        frames = parallel.decode_parallel(list(read_records(args.records)), workers=args.jobs, **settings)
+    else:
+        analyzer = create_analyzer(track_memory=bool(args.hex or args.bin), lazy_frames=bool(args.columns), bus_timing=args.timing, **settings)
+        if capture_file:
+            try:
+                frames = capture.iter_decode_capture(args.records, analyzer)
+            except capture.CaptureError as error:
+                parser.error(str(error))
+        elif args.fast:
+            import fastpath
+            frames = fastpath.iter_decode_fast(read_records(args.records), analyzer)
+        else:
+            frames = iter_decode(read_records(args.records), analyzer)
+
+    columns = None
+    if args.columns:
+        import export
+        columns = export.ColumnarWriter(args.columns)
+
+    writer = csv.writer(sys.stdout, delimiter='\t', lineterminator='\n')
+    writer.writerow(['start_time', 'end_time', 'count', 'data', 'command', 'response', 'pseudocode'])
+    for frame in frames:
+        writer.writerow([frame.start_time, frame.end_time, frame.data['count'], frame.data['data'],
+                         frame.data['command'], frame.data['response'], frame.data['pseudocode']])
+        if columns != None:
+            columns.write(frame)
+    if columns != None:
+        columns.close()
+
+    if analyzer != None and analyzer.memory != None:
+        if args.hex:
+            with open(args.hex, 'w') as file:
+                file.write(analyzer.memory.to_hex(args.region))
+        if args.bin:
+            with open(args.bin, 'wb') as file:
+                file.write(analyzer.memory.to_binary(args.region))
+
+if __name__ == '__main__':
+    main()
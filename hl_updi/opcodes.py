@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 
 OPCODES  = [
     # UNKNOWN
@@ -146,3 +148,50 @@ KEY_SIZE = {
     0x02 : 32,   # 32 Bytes
     0x03 : 32    # Documented as Reserved, but observed to be used and returns 32 bytes
 }
+
+
+# Pre-resolved decoder for a single opcode byte.  Sizes are None when the
+# opcode does not carry that field, so the decoder keeps its previous count.
+Opcode = namedtuple('Opcode', [
+    'name',             # Mnemonic from OPCODES
+    'type',             # get, set, ptr, repeat or unknown
+    'index',            # Position in OPCODES
+    'address_count',    # Address bytes expected (-1 reserved, None if no address)
+    'data_count',       # Data or key bytes expected (-1 reserved, None if no data)
+    'cs',               # Control/Status register number (None if not a register opcode)
+    'ack',              # True if an ACK follows the command
+    'address',          # Opcode carries an address
+    'data',             # Opcode carries data
+    'register',         # Opcode addresses a CS register
+    'key',              # Opcode carries a key
+])
+
+def resolve_opcode(byte):
+    # First definition in OPCODES that matches wins, same as a linear scan
+    for index, code in enumerate(OPCODES):
+        if (code['value'] == byte & (code['mask'] if 'mask' in code else 0xFF)):
+            address_count = None
+            data_count = None
+            if ('address' in code):
+                address_count = ADDRESS_SIZE[(byte & 0b1100) >> 2 if code['address'] == 'A' else (byte & 0b0011)]
+            if ('data' in code):
+                data_count = DATA_SIZE[(byte & 0b0011)] if not code['data'] == '1' else 1
+            if ('key' in code):
+                data_count = KEY_SIZE[byte & 0b11]
+            return Opcode(
+                name            = code['name'],
+                type            = code['type'],
+                index           = index,
+                address_count   = address_count,
+                data_count      = data_count,
+                cs              = byte & 0b1111 if 'register' in code else None,
+                ack             = 'ack' in code and code['ack'] == True,
+                address         = 'address' in code,
+                data            = 'data' in code,
+                register        = 'register' in code,
+                key             = 'key' in code,
+            )
+    return None
+
+# Every possible opcode byte, resolved once at import
+OPCODE_TABLE = tuple(resolve_opcode(byte) for byte in range(256))
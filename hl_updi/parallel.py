@@ -0,0 +1,90 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import offline
+from updi import States
+
+#########################################################################################
+# Parallel decoding of long captures
+#
+# The byte stream is cut in front of SYNC bytes and each segment is decoded by a
+# fresh analyzer in a worker process.  A cut is only correct if the analyzer that
+# decoded the previous segment ended up idle (no command in progress, no REPEAT
+# pending).  Where that is not the case the segment is decoded again here, and the
+# segments after it continue from its analyzer until a seam is idle again, so the
+# result always matches a sequential decode.
+#########################################################################################
+
+# Segments per worker, so uneven segments still balance out
+SEGMENTS_PER_WORKER = 4
+
+# Smallest segment worth sending to another process
+MINIMUM_SEGMENT = 4096
+
+# Analyzer state that has to match a fresh analyzer for a seam to be valid.
+# The pointer only shows up in the output of REPEAT block frames.
+def seam_state(analyzer):
+    command = analyzer.command
+    return (analyzer.state, analyzer.repeat_count, command.address_count, command.data_count,
+            command.mnemonic, analyzer.pointer if analyzer.block_repeats else None, analyzer.block_elements, len(analyzer.payload))
+
+IDLE_SEAM = (States.Start, 0, 0, 0, '', None, 0, 0)
+
+# Indexes to cut the records at, each one in front of a SYNC byte
+def split_points(records, segments):
+    size = max(len(records) // max(segments, 1), MINIMUM_SEGMENT)
+    points = [0]
+    for nominal in range(size, len(records), size):
+        index = max(nominal, points[-1] + 1)
+        while index < len(records) and records[index][-1] != 0x55:
+            index += 1
+        if index < len(records):
+            points.append(index)
+    points.append(len(records))
+    return points
+
+# Settings that build something from the whole capture in one analyzer (the bus timing,
+# memory image and index).  Each worker would only see its own segments.
+WHOLE_CAPTURE_SETTINGS = ('bus_timing', 'track_memory', 'build_index')
+
+# Decode one segment in a worker.  Frame counts continue from the segment's offset.
+# Only the frames go back, with whether the segment ended idle: analyzers do not pickle.
+def decode_segment(segment):
+    records, offset, settings = segment
+    analyzer = offline.create_analyzer(**settings)
+    analyzer.opcode_start = offset
+    frames = list(offline.iter_decode(records, analyzer))
+    return frames, seam_state(analyzer) == IDLE_SEAM
+
+def decode_parallel(records, workers=None, **settings):
+    for name in WHOLE_CAPTURE_SETTINGS:
+        if settings.get(name):
+            raise ValueError('%s needs a single process decode' % name)
+    records = records if isinstance(records, list) else list(records)
+    workers = workers or os.cpu_count() or 1
+    points = split_points(records, workers * SEGMENTS_PER_WORKER)
+    segments = [(records[start:end], start, settings) for start, end in zip(points, points[1:])]
+    # Collapsed polling runs and held back resync frames can span any number of segments,
+    # and statistics are counted by each analyzer
+    if len(segments) < 2 or workers < 2 or settings.get('PollingFrames', 'Each') != 'Each' or settings.get('Resync', 'Off') != 'Off' \
+            or settings.get('Statistics', 'Off') != 'Off':
+        return offline.decode_records(records, **settings)
+
+    frames = []
+    previous = None
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (segment_records, offset, _), (segment_frames, idle) in zip(segments, pool.map(decode_segment, segments)):
+            if previous != None:
+                # The cut landed inside a command or REPEAT, carry on from where the previous segment stopped
+                analyzer = previous
+            elif not idle:
+                # The next segment has to carry on from this one, decode it again here to get there
+                analyzer = offline.create_analyzer(**settings)
+                analyzer.opcode_start = offset
+            else:
+                frames.extend(segment_frames)
+                continue
+            frames.extend(offline.iter_decode(segment_records, analyzer))
+            analyzer.frames = []
+            previous = analyzer if seam_state(analyzer) != IDLE_SEAM else None
+    return frames
@@ -0,0 +1,198 @@
+from saleae.analyzers import AnalyzerFrame
+
+#########################################################################################
+# Polling loop compression
+#
+# Debuggers spin on LDCS STATUSA / LDCS ASI_SYS_STATUS while they wait for the target.
+# With PollingFrames set to Collapse, frames from hla are passed through this stage,
+# which recognises a sequence of up to POLL_PERIOD frames repeating back to back and
+# replaces the whole run with one frame.  Only a bounded number of frames is ever held
+# back, so a run of any length costs constant memory.
+#
+# Logic 2 never tells an analyzer that the capture has ended, so a frame held back
+# until the end of its run would never be shown there.  A long run is shown as it goes
+# instead, one POLL frame for every POLL_HOLD of it; only the last of those and the few
+# frames in the window are still held when the capture stops, and only flush (offline
+# decoding) gets them out.
+#
+# IDLE frames are time between commands, not commands: they are left out of the repeat
+# detection, go into the run they fall in and are shown as they are outside runs.  More
+# than POLL_IDLE of them in a row end a run.
+#########################################################################################
+
+# Longest repeating sequence recognised, in frames
+POLL_PERIOD = 4
+
+# A sequence has to repeat this many times before it is collapsed
+POLL_MINIMUM = 4
+
+# IDLE frames in a row held back at most
+POLL_IDLE = 16
+
+# Longest part of a run held back before it is shown as a POLL frame of its own (seconds)
+POLL_HOLD = 0.1
+
+# Frames with the same payload bytes and mnemonic decode identically (same opcode,
+# CS, data and response)
+def signature(frame):
+    decoded = getattr(frame.data, 'decoded', None)
+    if decoded != None:
+        return (decoded.payload, decoded.command)
+    return (frame.data.get('data'), frame.data.get('command'))
+
+def is_idle(frame):
+    decoded = getattr(frame.data, 'decoded', None)
+    return (decoded.command if decoded != None else frame.data.get('command')) == 'IDLE'
+
+class PollingCompressor:
+
+    def __init__(self, period=POLL_PERIOD, minimum=POLL_MINIMUM, idle=POLL_IDLE, hold=POLL_HOLD):
+        self.period = period
+        self.minimum = max(minimum, 2)
+        self.idle_limit = idle
+        self.hold = hold
+        self.window = []        # Recent frames, not yet known to be outside a run
+        self.pattern = None     # Signatures of the repeating sequence
+        self.first = []         # Frames of the first repeat, to describe the run
+        self.run = []           # Frames of the run, only until it is long enough to collapse
+        self.partial = []       # Frames of the sequence currently being repeated
+        self.matched = 0        # Commands in partial
+        self.idle = 0           # IDLE frames in a row held back
+        self.repeats = 0
+        self.shown = 0          # Repeats already shown in POLL frames of this run
+        self.start_time = None  # Start of the part of the run not shown yet
+        self.end_time = None
+        self.last = None        # Last frame of the run, for its count
+
+    # Pass a batch of frames through, returning the frames that can be shown now
+    def feed(self, frames):
+        output = []
+        for frame in frames:
+            self.add(frame, output)
+        return output
+
+    def add(self, frame, output):
+        if is_idle(frame):
+            self.add_idle(frame, output)
+            return
+        self.idle = 0
+
+        if self.pattern != None:
+            if signature(frame) == self.pattern[self.matched]:
+                self.partial.append(frame)
+                self.matched += 1
+                if self.matched == len(self.pattern):
+                    self.repeat(self.partial, output)
+                    self.partial = []
+                    self.matched = 0
+                return
+            # The run is over, what was part way into another repeat is looked at again
+            self.restart(self.partial + [frame], output)
+            return
+
+        window = self.window
+        window.append(frame)
+        # Positions of the commands in the window
+        positions = [index for index, frame in enumerate(window) if not is_idle(frame)]
+        commands = [window[index] for index in positions]
+        period = self.find_period(commands)
+        if period:
+            # Everything in front of the two repeats is not part of the run
+            start = positions[-2 * period]
+            middle = positions[-period]
+            output.extend(window[:start])
+            self.window = []
+            self.pattern = tuple(signature(frame) for frame in commands[-2 * period:-period])
+            self.first = commands[-2 * period:-period]
+            self.start_time = window[start].start_time
+            self.run = []
+            self.repeats = 0
+            self.shown = 0
+            self.repeat(window[start:middle], output)
+            self.repeat(window[middle:], output)
+        elif len(commands) >= 2 * self.period:
+            # The oldest command and the IDLE frames after it
+            output.append(self.window.pop(0))
+            while is_idle(self.window[0]):
+                output.append(self.window.pop(0))
+
+    def add_idle(self, frame, output):
+        self.idle += 1
+        if self.pattern != None:
+            self.partial.append(frame)
+            if self.idle > self.idle_limit:
+                self.restart(self.partial, output)
+            return
+        if not self.window or self.idle > self.idle_limit:
+            output.extend(self.window)
+            output.append(frame)
+            self.window = []
+        else:
+            self.window.append(frame)
+
+    # End the run and pass the frames held after it through again
+    def restart(self, pending, output):
+        self.end_run(output)
+        self.idle = 0
+        for frame in pending:
+            self.add(frame, output)
+
+    # Shortest period for which the commands end in two identical sequences
+    def find_period(self, commands):
+        for period in range(1, self.period + 1):
+            if len(commands) < 2 * period:
+                break
+            if all(signature(commands[-period - offset - 1]) == signature(commands[-offset - 1]) for offset in range(period)):
+                return period
+        return 0
+
+    def repeat(self, frames, output):
+        self.repeats += 1
+        self.end_time = frames[-1].end_time
+        self.last = frames[-1]
+        if self.repeats < self.minimum:
+            self.run.extend(frames)
+            return
+        self.run = []
+        if self.end_time - self.start_time >= self.hold:
+            # Shown now, the run goes on from here
+            output.append(self.summary())
+            self.shown = self.repeats
+            self.start_time = self.end_time
+
+    def end_run(self, output):
+        if self.repeats > self.shown and self.repeats >= self.minimum:
+            output.append(self.summary())
+        else:
+            output.extend(self.run)
+        self.pattern = None
+        self.first = []
+        self.run = []
+        self.partial = []
+        self.matched = 0
+        self.repeats = 0
+        self.shown = 0
+        self.last = None
+
+    # The repeats since the last POLL frame of the run
+    def summary(self):
+        first = [frame.data for frame in self.first]
+        repeats = self.repeats - self.shown
+        return AnalyzerFrame('UPDI', self.start_time, self.end_time, {
+            'count' : self.last.data['count'],
+            'data' : ' / '.join(data['data'] for data in first),
+            'command' : 'POLL %s x %d' % (' / '.join(data['command'].strip() for data in first), repeats),
+            'response' : ' / '.join(data['response'] for data in first),
+            'pseudocode' : 'Repeated %d times' % repeats if self.shown == 0 else 'Repeated %d more times, %d in all' % (repeats, self.repeats),
+            'period' : len(first),
+            'repeats' : repeats,
+        })
+
+    # End of capture, release everything still held back
+    def flush(self):
+        output = []
+        while self.pattern != None:
+            self.restart(self.partial, output)
+        output.extend(self.window)
+        self.window = []
+        return output
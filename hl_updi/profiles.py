@@ -0,0 +1,213 @@
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+from collections import namedtuple
+
+from registers import REGISTER_DEFINITIONS, REGISTER_COUNT, build_register_tables
+
+#########################################################################################
+# Device profiles
+#
+# Each part is described by a JSON file in devices/: its memory map, named I/O
+# registers, the KEY names and (optionally) CS register definitions replacing the
+# defaults in registers.py.  The files are validated and compiled once, register
+# tables included, into a pickle next to them.  Later starts load the pickle as long
+# as the hash of the profiles and of the code that compiles them is unchanged, and
+# every lookup is a dict access however many parts are installed.
+#
+# Nothing is compiled or loaded at import: Logic 2 creates a new analyzer every time
+# it is added or the capture reruns, so profiles are loaded on the first decode and
+# then shared by every analyzer in the process.
+#########################################################################################
+
+DEVICE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'devices')
+PROFILE_CACHE = os.path.join(DEVICE_DIRECTORY, 'profiles.cache')
+
+# Bumped whenever the compiled form changes
+PROFILE_FORMAT = 1
+
+# The part this analyzer was built and tested with, listed first so it is the default
+DEFAULT_DEVICE = 'ATtiny1616'
+
+Profile = namedtuple('Profile', [
+    'name',             # Part name, as shown in the Device setting
+    'family',           # tinyAVR 1-series, AVR DA, ...
+    'memory_map',       # ((region name, first address, last address), ...) in address order
+    'io_registers',     # Address -> register name
+    'keys',             # KEY bytes as sent (least significant byte first) -> key name
+    'registers',        # CS number -> register definition
+    'register_tables',  # ShowUnknownBits -> (names, values) as built by build_register_tables
+])
+
+class ProfileError(ValueError):
+    pass
+
+def number(value, source, what):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value, 0)
+        except ValueError:
+            pass
+    raise ProfileError('%s: %s %r is not a number' % (source, what, value))
+
+# JSON keys are strings, register value tables are keyed by number
+def register_definition(register, source):
+    if not isinstance(register, dict) or 'number' not in register:
+        raise ProfileError('%s: register definitions need a number' % source)
+    register = dict(register)
+    register['number'] = number(register['number'], source, 'register')
+    if not 0 <= register['number'] < REGISTER_COUNT:
+        raise ProfileError('%s: register 0x%02X is not a CS address' % (source, register['number']))
+    if 'values' in register:
+        register['values'] = {number(key, source, 'value'): text for key, text in register['values'].items()}
+    if 'components' in register:
+        components = []
+        for component in register['components']:
+            component = dict(component)
+            if 'values' in component:
+                component['values'] = {number(key, source, 'value'): text for key, text in component['values'].items()}
+            if 'mask' in component:
+                component['mask'] = number(component['mask'], source, 'mask')
+            components.append(component)
+        register['components'] = components
+    return register
+
+# Check a profile read from JSON and turn it into its compiled form
+def compile_profile(definition, source):
+    for field in ('name', 'memory_map'):
+        if field not in definition:
+            raise ProfileError('%s: missing %s' % (source, field))
+    name = definition['name']
+    if not isinstance(name, str) or not name:
+        raise ProfileError('%s: name must be a non-empty string' % source)
+
+    memory_map = []
+    for entry in definition['memory_map']:
+        if not isinstance(entry, list) or len(entry) != 3:
+            raise ProfileError('%s: memory map entries are [name, first, last]' % source)
+        region, start, end = entry[0], number(entry[1], source, 'address'), number(entry[2], source, 'address')
+        if start > end:
+            raise ProfileError('%s: %s ends before it starts' % (source, region))
+        if memory_map and start <= memory_map[-1][2]:
+            raise ProfileError('%s: %s overlaps or is out of order' % (source, region))
+        memory_map.append((region, start, end))
+
+    io_registers = {}
+    for address, register in definition.get('io_registers', {}).items():
+        address = number(address, source, 'I/O register address')
+        if not any(start <= address <= end for region, start, end in memory_map):
+            raise ProfileError('%s: I/O register %s is outside the memory map' % (source, register))
+        io_registers[address] = register
+
+    keys = {}
+    for key, key_name in definition.get('keys', {}).items():
+        if len(key) not in (8, 16, 32):
+            raise ProfileError('%s: KEY %r is not 8, 16 or 32 characters' % (source, key))
+        keys[key.encode('latin-1')[::-1]] = key_name
+
+    registers = dict(REGISTER_DEFINITIONS)
+    for register in definition.get('registers', []):
+        register = register_definition(register, source)
+        registers[register['number']] = register
+
+    return Profile(
+        name            = name,
+        family          = definition.get('family', ''),
+        memory_map      = tuple(memory_map),
+        io_registers    = io_registers,
+        keys            = keys,
+        registers       = registers,
+        register_tables = {unknown_bits: build_register_tables(unknown_bits, registers) for unknown_bits in (False, True)},
+    )
+
+# Code the compiled profiles depend on, besides the JSON files
+SOURCES = ('profiles.py', 'registers.py')
+
+# Hash of everything that goes into the compiled profiles, the cache is only used if it matches
+def source_hash(directory):
+    digest = hashlib.sha256(b'%d' % PROFILE_FORMAT)
+    source_directory = os.path.dirname(os.path.abspath(__file__))
+    paths = [os.path.join(source_directory, filename) for filename in SOURCES]
+    paths += [os.path.join(directory, filename) for filename in sorted(os.listdir(directory)) if filename.endswith('.json')]
+    for path in paths:
+        digest.update(os.path.basename(path).encode() + b'\0')
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def compile_profiles(directory):
+    profiles = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        path = os.path.join(directory, filename)
+        with open(path) as file:
+            try:
+                definition = json.load(file)
+            except ValueError as error:
+                raise ProfileError('%s: %s' % (filename, error))
+        profile = compile_profile(definition, filename)
+        if profile.name in profiles:
+            raise ProfileError('%s: %s is already defined' % (filename, profile.name))
+        profiles[profile.name] = profile
+    return profiles
+
+def load_profiles(directory=DEVICE_DIRECTORY, cache=PROFILE_CACHE):
+    digest = source_hash(directory)
+    try:
+        with open(cache, 'rb') as file:
+            cached_digest, profiles = pickle.load(file)
+        if cached_digest == digest:
+            return profiles
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError, ImportError, TypeError, IndexError):
+        # Missing, stale or from another version, compiled again
+        pass
+
+    profiles = compile_profiles(directory)
+    # Written beside the cache and moved into place, so another process loading it at
+    # the same time sees either the old file or the new one
+    temporary = None
+    try:
+        descriptor, temporary = tempfile.mkstemp(prefix=os.path.basename(cache) + '.', dir=os.path.dirname(cache))
+        with os.fdopen(descriptor, 'wb') as file:
+            pickle.dump((digest, profiles), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, cache)
+    except OSError:
+        # Read only install, compile again next time
+        if temporary != None and os.path.exists(temporary):
+            os.remove(temporary)
+    return profiles
+
+# Compiled profiles, shared by every analyzer in the process once loaded
+_profiles = None
+
+def loaded_profiles():
+    global _profiles
+    if _profiles == None:
+        _profiles = load_profiles()
+    return _profiles
+
+# Part names for the Device setting, read without compiling anything
+def device_names(directory=DEVICE_DIRECTORY):
+    names = []
+    for filename in os.listdir(directory):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory, filename)) as file:
+                try:
+                    name = json.load(file).get('name')
+                except ValueError:
+                    continue
+            if isinstance(name, str) and name:
+                names.append(name)
+    # The default part first
+    return sorted(names, key=lambda name: (name != DEFAULT_DEVICE, name))
+
+DEVICE_NAMES = device_names()
+
+def profile(name):
+    profiles = loaded_profiles()
+    return profiles[name] if name in profiles else profiles[DEFAULT_DEVICE]
@@ -1,3 +1,5 @@
+import sys
+
 REGISTERS = [
     { 
         "number"    : 0x00,
@@ -78,7 +80,7 @@ REGISTERS = [
             },
             {
                 "name"      : "GTVAL",
-                "mask"      : 0x00000111,
+                "mask"      : 0b00000111,
                 "values"    : {
                     0 : '128 Cycles',
                     1 : '64 Cycles',
@@ -331,6 +333,74 @@ REGISTERS = [
     }
 ]
 
+# Register definitions by CS number
+REGISTER_DEFINITIONS = { register['number'] : register for register in REGISTERS if 'number' in register }
+
+# CS addresses are the low 4 bits of the LDCS/STCS opcode
+REGISTER_COUNT = 16
+
+# Decode a CS register value into its display string
+def render_register(cs, data, unknown_bits, definitions=REGISTER_DEFINITIONS):
+
+    register_parts = []
+
+    # Defaults if no definition is found
+    register = definitions[cs] if cs in definitions else None
+    if (register != None):
+
+        # Check if this register has one or more defined portions
+        if 'components' in register:
+            for component in register['components']:
+
+                # Handle groups of bits
+                if 'bits' in component and unknown_bits==True:
+                    for bit in component['bits']:
+                        component_value = ((1 << bit) & data) >> (bit)
+                        component_name = component['name'] if 'name' in component else 'Bit%d' % bit
+                        register_parts.append('%s %s' % (component_name, 'on' if component_value>0 else 'off' ))
+
+                # Handle individual bit
+                elif ('bit' in component):
+                    component_value = ((1 << component['bit']) & data) >> (component['bit'])
+                    if 'values' in component:
+                        component_definition = component['values'][component_value]
+                    else:
+                        component_definition = 'on' if component_value>0 else 'off'
+                    component_name = component['name'] if 'name' in component else 'Bit%d' % component['bit']
+                    register_parts.append('%s = %s' % (component_name, component_definition))
+
+                # Handle masked amounts
+                elif ('mask' in component):
+                    component_value = (data & component['mask']) >> (component['shift'] if 'shift' in component else 0)
+                    if ('values' in component and component_value in component['values']):
+                        component_definition = component['values'][component_value]
+                    else:
+                        component_definition = '0x%02X' % component_value
+                    component_name = component['name'] if 'name' in component else 'Unnamed Mask %02X' % component['mask']
+                    register_parts.append('%s = %s' % (component_name, component_definition ))
+
+        # Assume Full byte value
+        else:
+            component_definition = register['values'][data] if ('values' in register and data in register['values']) else '0x%02X' % data
+            component_name = register['name'] if 'name' in register else 'Register %02X' % cs
+            register_parts.append('%s = %s' % (component_name, component_definition ))
+
+    return (' ,'.join(register_parts))
 
+# Names indexed by CS, rendered values indexed by [CS][value]
+def build_register_tables(unknown_bits, definitions=REGISTER_DEFINITIONS):
+    names = []
+    values = []
+    for cs in range(REGISTER_COUNT):
+        register = definitions[cs] if cs in definitions else None
+        names.append(sys.intern(register['name'] if register != None and 'name' in register else ''))
+        values.append(tuple(sys.intern(render_register(cs, data, unknown_bits, definitions)) for data in range(256)))
+    return (tuple(names), tuple(values))
 
+# Compiled (names, values) tables of the default definitions, keyed on the ShowUnknownBits setting
+_register_tables = {}
 
+def register_tables(unknown_bits):
+    if unknown_bits not in _register_tables:
+        _register_tables[unknown_bits] = build_register_tables(unknown_bits)
+    return _register_tables[unknown_bits]
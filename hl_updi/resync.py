@@ -0,0 +1,153 @@
+from opcodes import OPCODE_TABLE
+
+#########################################################################################
+# Resynchronisation after framing errors
+#
+# A dropped or corrupted byte leaves hla expecting the wrong number of address/data
+# bytes, and the SYNC of the next command is swallowed as data.  With Resync on, each
+# byte goes through this stage first.  A SYNC that arrives in the middle of a command
+# is remembered as a candidate boundary, together with the analyzer state just before
+# it, and the frames decoded after it are held back.  The command is then checked:
+#
+#   - an ACK position that does not hold 0x40
+#   - a byte between commands that is not SYNC, IDLE or BREAK
+#   - an invalid opcode
+#
+# each mean the candidate was the real start of the next command.  The analyzer is
+# put back to the candidate, the command it was in is shown cut short, and the bytes
+# from the candidate on are decoded again.  A clean ACK, or a clean start of the next
+# command, confirms the original decode and releases the held frames.  Only
+# RESYNC_BUFFER bytes are ever kept, a candidate that old is given up on.
+#
+# Held frames only come out when a later byte settles the candidate.  Logic 2 never
+# tells an analyzer that the capture has ended, so if it stops while a candidate is
+# open those frames (at most RESYNC_BUFFER bytes' worth) are not shown there.  A quiet
+# gap on the bus does not settle anything, a dropped byte looks the same, so it is
+# not taken as a boundary.  Offline decoding gets them out with flush.
+#
+# Framing errors reported by ll_updi (BREAK, WRONG_BIT, NARROW frames), or by the
+# offline edge decoder (PARITY_ERROR, FRAMING_ERROR), in the middle of a command end
+# that command straight away.
+#
+# The index is rolled back with the analyzer, so its rows stay in time order.  The
+# memory image is not, it may hold a command that was later found to be misaligned.
+#########################################################################################
+
+# Bytes kept after a candidate boundary before it is given up on
+RESYNC_BUFFER = 32
+
+# Frame types that mean the bit stream lost its framing
+FRAMING_ERRORS = ('BREAK', 'WRONG_BIT', 'NARROW', 'PARITY_ERROR', 'FRAMING_ERROR')
+
+# Bytes that can start a frame between commands
+BOUNDARY_BYTES = (0x55, 0xFF, 0x00)
+
+class Resynchronizer:
+
+    def __init__(self, analyzer, size=RESYNC_BUFFER):
+        self.analyzer = analyzer
+        self.size = size
+        self.saved = None           # Analyzer state just before the candidate SYNC
+        self.cut = None             # Last frame before the candidate, where the cut command ends
+        self.buffer = []            # Input frames from the candidate on
+        self.pending = []           # Output frames held back while the candidate is open
+        self.previous = None        # Last input frame
+        self.resyncs = 0            # Commands cut short
+        self.rollbacks = 0          # Of those, found by a candidate boundary
+
+    def decode(self, decode, frame):
+        analyzer = self.analyzer
+        if 'data' not in frame.data:
+            return decode(frame)
+        byte = frame.data['data'][0]
+        output = []
+
+        # Lost framing, nothing in progress can be trusted
+        if frame.type in FRAMING_ERRORS and not analyzer.idle():
+            self.release(output)
+            if self.previous != None:
+                output.extend(self.cut_short(self.previous, 'Framing error'))
+
+        elif self.saved != None:
+            if self.misaligned(byte):
+                return output + self.rollback(decode, frame)
+            if analyzer.idle():
+                # The command containing the candidate ended cleanly and the next one starts where expected
+                self.release(output)
+
+        elif analyzer.command.opcode != None and analyzer.command.opcode.ack and analyzer.state.name == 'Ack' \
+                and byte == 0x55 and analyzer.repeat_count == 0:
+            # The ACK never came, this is already the next command
+            analyzer.frames = []
+            analyzer.command.acked = False
+            analyzer.complete_now(self.previous)
+            output.extend(analyzer.frames)
+
+        elif byte == 0x55 and analyzer.state.name in ('Address', 'Data') and analyzer.repeat_count == 0:
+            # Possibly the start of the next command, keep enough to come back here
+            self.saved = analyzer.save_state()
+            self.cut = self.previous
+
+        frames = decode(frame)
+        self.previous = frame
+        if self.saved == None:
+            output.extend(frames)
+            return output
+
+        self.buffer.append(frame)
+        self.pending.extend(frames)
+        if analyzer.state.name == 'Start' and analyzer.command.acked and analyzer.command.opcode != None and analyzer.command.opcode.ack:
+            # ACKed where expected, the original decode was right
+            self.release(output)
+        elif len(self.buffer) >= self.size:
+            self.release(output)
+        return output
+
+    # Does this byte show the bytes since the candidate were decoded out of step?
+    def misaligned(self, byte):
+        analyzer = self.analyzer
+        state = analyzer.state.name
+        if state == 'Ack':
+            return byte != 0x40
+        if state == 'Start':
+            return byte not in BOUNDARY_BYTES
+        if state == 'Opcode' and analyzer.command.repeat_byte == None:
+            return OPCODE_TABLE[byte] == None
+        return False
+
+    # Go back to the candidate, cut the command it interrupted short and decode again from it
+    def rollback(self, decode, frame):
+        analyzer = self.analyzer
+        frames = self.buffer + [frame]
+        analyzer.restore_state(self.saved)
+        self.rollbacks += 1
+        output = self.cut_short(self.cut, 'Resynchronised at SYNC')
+        self.saved = None
+        self.cut = None
+        self.buffer = []
+        self.pending = []
+        self.previous = None
+        for frame in frames:
+            output.extend(self.decode(decode, frame))
+        return output
+
+    def cut_short(self, frame, reason):
+        self.resyncs += 1
+        analyzer = self.analyzer
+        analyzer.frames = []
+        analyzer.abandon_command(frame, reason)
+        return analyzer.frames
+
+    # Keep the decode as it is
+    def release(self, output):
+        output.extend(self.pending)
+        self.saved = None
+        self.cut = None
+        self.buffer = []
+        self.pending = []
+
+    # End of capture
+    def flush(self):
+        output = []
+        self.release(output)
+        return output
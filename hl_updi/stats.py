@@ -0,0 +1,128 @@
+import sys
+import time
+
+from textcache import cache_stats
+
+# Print the statistics every this many input bytes (Logic 2 has no end of capture callback)
+STATS_INTERVAL = 1 << 20
+
+# Decoder statistics.  Only created when the Statistics setting is on, the
+# analyzer then dispatches through wrapped handlers that feed these counters.
+class DecoderStats:
+
+    def __init__(self, interval=STATS_INTERVAL):
+        self.interval = interval
+        self.bytes = 0
+        self.frames = 0
+        self.state_bytes = {}
+        self.handler_calls = {}
+        self.handler_time = {}
+        self.opcodes = {}
+        self.invalid_opcodes = 0
+        self.unknown_bytes = 0
+        self.acks = 0
+        self.missing_acks = 0
+        self.resync = None          # The analyzer's Resynchronizer, when Resync is on
+        self.started = time.perf_counter()
+
+    # Wrap the analyzer's state handlers so each call is counted and timed
+    def instrument(self, analyzer):
+        handlers = {}
+        for state, handler in analyzer.state_handlers().items():
+            handler = self.timed(state.name, handler)
+            # Protocol counters ride along on the handlers that see the events
+            if state.name == 'Start':
+                handler = self.start_counter(handler)
+            elif state.name == 'Opcode':
+                handler = self.opcode_counter(handler, analyzer)
+            elif state.name == 'Ack':
+                handler = self.ack_counter(handler, analyzer)
+            handlers[state] = handler
+        return handlers
+
+    def start_counter(self, handler):
+        def capture_start(byte, frame):
+            if byte not in (0x55, 0xFF, 0x00):
+                self.unknown_bytes += 1
+            return handler(byte, frame)
+        return capture_start
+
+    def opcode_counter(self, handler, analyzer):
+        def capture_opcode(byte, frame):
+            result = handler(byte, frame)
+            code = analyzer.command.opcode
+            if code == None:
+                self.invalid_opcodes += 1
+            else:
+                self.opcodes[code.name] = self.opcodes.get(code.name, 0) + 1
+            return result
+        return capture_opcode
+
+    def ack_counter(self, handler, analyzer):
+        def capture_ack(byte, frame):
+            result = handler(byte, frame)
+            if analyzer.command.acked:
+                self.acks += 1
+            else:
+                self.missing_acks += 1
+            return result
+        return capture_ack
+
+    def timed(self, name, handler):
+        self.handler_calls[name] = 0
+        self.handler_time[name] = 0.0
+        def call(byte, frame):
+            start = time.perf_counter()
+            result = handler(byte, frame)
+            self.handler_time[name] += time.perf_counter() - start
+            self.handler_calls[name] += 1
+            return result
+        return call
+
+    # Wrap decode to count input bytes by the state they arrive in, and frames out
+    def decoder(self, decode, analyzer):
+        self.resync = analyzer.resync
+        def counted(frame):
+            state = analyzer.state.name
+            frames = decode(frame)
+            self.bytes += 1
+            self.state_bytes[state] = self.state_bytes.get(state, 0) + 1
+            self.frames += len(frames)
+            if self.interval and self.bytes % self.interval == 0:
+                self.dump()
+            return frames
+        return counted
+
+    def as_dict(self):
+        return {
+            'bytes'             : self.bytes,
+            'frames'            : self.frames,
+            'frames_per_byte'   : self.frames / self.bytes if self.bytes else 0.0,
+            'state_bytes'       : dict(self.state_bytes),
+            'handler_calls'     : dict(self.handler_calls),
+            'handler_time'      : dict(self.handler_time),
+            'opcodes'           : dict(self.opcodes),
+            'invalid_opcodes'   : self.invalid_opcodes,
+            'unknown_bytes'     : self.unknown_bytes,
+            'acks'              : self.acks,
+            'missing_acks'      : self.missing_acks,
+            'resyncs'           : self.resync.resyncs if self.resync != None else 0,
+            'rollbacks'         : self.resync.rollbacks if self.resync != None else 0,
+            'string_cache'      : cache_stats(),
+            'elapsed'           : time.perf_counter() - self.started,
+        }
+
+    def dump(self, file=None):
+        file = file or sys.stdout
+        stats = self.as_dict()
+        print('UPDI decoder: %d bytes, %d frames (%.3f frames/byte), %.3f s' % (
+            stats['bytes'], stats['frames'], stats['frames_per_byte'], stats['elapsed']), file=file)
+        print('  bytes by state: %s' % ', '.join('%s %d' % item for item in sorted(stats['state_bytes'].items())), file=file)
+        for name in sorted(stats['handler_time'], key=lambda name: -stats['handler_time'][name]):
+            print('  %-10s %10d calls %9.3f s' % (name, stats['handler_calls'][name], stats['handler_time'][name]), file=file)
+        print('  opcodes: %s' % ', '.join('%s %d' % item for item in sorted(stats['opcodes'].items(), key=lambda item: -item[1])), file=file)
+        print('  sync losses: %d invalid opcodes, %d unknown bytes, %d commands cut short (%d at a later SYNC)' % (
+            stats['invalid_opcodes'], stats['unknown_bytes'], stats['resyncs'], stats['rollbacks']), file=file)
+        print('  acks: %d, missing acks: %d' % (stats['acks'], stats['missing_acks']), file=file)
+        print('  string cache: %s' % ', '.join('%s %d hits %d misses %d/%d' % (name, cache['hits'], cache['misses'], cache['size'], cache['limit'])
+                                                for name, cache in stats['string_cache'].items()), file=file)
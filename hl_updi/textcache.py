@@ -0,0 +1,47 @@
+from functools import lru_cache
+
+#########################################################################################
+# Formatted string cache
+#
+# Most payloads are 1-3 bytes and the same pointers, register values and polls come
+# round again and again.  The strings shown for them are cached on the raw bytes, so
+# each one is formatted once and the same string object is shared by every frame.
+#########################################################################################
+
+# Entries kept per cache, least recently used are dropped first
+STRING_CACHE_SIZE = 4096
+
+# '0x00' .. '0xFF'
+BYTE_HEX = tuple('0x%02X' % value for value in range(256))
+
+# '0x55 80 30'
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def spaced_hex(data):
+    return '0x' + data.hex(' ').upper()
+
+# '0x558030'
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def packed_hex(data):
+    return '0x' + data.hex().upper()
+
+# '"NVMProg "'
+@lru_cache(maxsize=STRING_CACHE_SIZE)
+def quoted_text(data):
+    return '"' + data.decode('latin-1') + '"'
+
+CACHES = {
+    'spaced_hex'    : spaced_hex,
+    'packed_hex'    : packed_hex,
+    'quoted_text'   : quoted_text,
+}
+
+def cache_stats():
+    stats = {}
+    for name, function in CACHES.items():
+        info = function.cache_info()
+        stats[name] = {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'limit': info.maxsize}
+    return stats
+
+def cache_clear():
+    for function in CACHES.values():
+        function.cache_clear()
@@ -0,0 +1,262 @@
+import sys
+import math
+
+#########################################################################################
+# Bus timing analytics
+#
+# How the time on the UPDI line is spent, measured from the input byte frames as hla
+# decodes them: how long each command takes from its first byte to its last, the idle
+# gap before the next one, how long the target takes to turn the line around for an
+# ACK or for the bytes it sends back, and the payload moved per second.  Each of these
+# goes into a StreamingHistogram, so a capture of any length costs the same memory.
+#
+# Every time the line turns around the UPDI waits out its guard time, GTVAL in CTRLA
+# (128 bits after reset, set with STCS).  The configured guard time is followed
+# through the STCS writes and summed over the turnarounds, to show how much of the
+# turnaround latency is guard time that a shorter GTVAL would save.
+#
+# Only for offline decoding (create_analyzer(bus_timing=True), hla.timing).
+#########################################################################################
+
+# Bits of a UPDI frame: start, 8 data, even parity, 2 stop
+BYTE_BITS = 12
+
+# CS register holding GTVAL, and the guard time it holds after a reset, in bits
+GUARD_REGISTER = 0x02
+DEFAULT_GUARD_BITS = 128
+
+# Histogram resolution: buckets per doubling of the value, and the range covered
+BUCKETS_PER_OCTAVE = 8
+SMALLEST_VALUE = 1e-9
+OCTAVES = 40
+
+# Counts of values in logarithmic buckets.  Quantiles are known to within one bucket
+# (about 9% with 8 buckets per octave), count, total, minimum and maximum exactly.
+class StreamingHistogram:
+
+    def __init__(self, smallest=SMALLEST_VALUE, buckets_per_octave=BUCKETS_PER_OCTAVE, octaves=OCTAVES):
+        self.smallest = smallest
+        self.buckets_per_octave = buckets_per_octave
+        # Bucket 0 holds values up to smallest, the last one everything past the range
+        self.counts = [0] * (octaves * buckets_per_octave + 2)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def bucket(self, value):
+        if value <= self.smallest:
+            return 0
+        return min(int(math.log2(value / self.smallest) * self.buckets_per_octave) + 1, len(self.counts) - 1)
+
+    # Lower edge of a bucket
+    def edge(self, bucket):
+        return self.smallest * 2 ** ((bucket - 1) / self.buckets_per_octave) if bucket > 0 else 0.0
+
+    def add(self, value):
+        self.counts[self.bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.minimum == None or value < self.minimum:
+            self.minimum = value
+        if self.maximum == None or value > self.maximum:
+            self.maximum = value
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    # Value below which this fraction of the values lie, the middle of its bucket
+    def quantile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                middle = math.sqrt(self.edge(bucket) * self.edge(bucket + 1)) if bucket > 0 else self.smallest
+                return min(max(middle, self.minimum), self.maximum)
+        return self.maximum
+
+    # [(low, high, count)] for the buckets holding any values
+    def buckets(self):
+        return [(self.edge(bucket), self.edge(bucket + 1), count) for bucket, count in enumerate(self.counts) if count]
+
+    def as_dict(self):
+        return {
+            'count'     : self.count,
+            'total'     : self.total,
+            'mean'      : self.mean(),
+            'min'       : self.minimum,
+            'max'       : self.maximum,
+            'p50'       : self.quantile(.5),
+            'p90'       : self.quantile(.9),
+            'p99'       : self.quantile(.99),
+        }
+
+# Guard time in bits for a CTRLA value, from the GTVAL values of the register
+# definition ('128 Cycles', ...).  None for a reserved value.
+def guard_bits(register, value):
+    components = register.get('components', []) if register != None else []
+    for component in components:
+        if component.get('name') == 'GTVAL':
+            field = (value & component['mask']) >> component.get('shift', 0)
+            words = component.get('values', {}).get(field, '').split()
+            return int(words[0]) if words and words[0].isdigit() else None
+    return None
+
+class BusTiming:
+
+    # baud fixes the bit rate used for guard times, otherwise it is taken from the SYNC
+    # frames (the baud rate ll_updi measures, or the width of the frame)
+    def __init__(self, baud=None):
+        self.durations = StreamingHistogram()           # Command, first byte start to last byte end
+        self.gaps = StreamingHistogram()                # End of a command to the start of the next
+        self.ack_turnaround = StreamingHistogram()      # Last byte sent to the start of its ACK
+        self.response_turnaround = StreamingHistogram() # Last byte sent to the first byte loaded back
+        self.commands = 0               # Commands and REPEAT elements completed
+        self.payload_bytes = 0          # Data and key bytes moved either way
+        self.busy_time = 0.0            # Time within commands
+        self.guard_time = 0.0           # Configured guard time, over every turnaround
+        self.turnaround_time = 0.0      # Measured turnaround time, over every turnaround
+        self.first_time = None
+        self.last_time = None
+        self.fixed_bit_time = 1 / baud if baud else None
+        self.bit_time = self.fixed_bit_time
+        self.guard_bits = DEFAULT_GUARD_BITS
+        self.command_start = None       # Start of the command in progress
+        self.command_end = None         # End of the last command
+        self.byte_end = None            # End of the last byte
+        self.from_target = False        # Did the target send the last byte?
+
+    # Wrap decode to time each byte against the state it arrives in
+    def decoder(self, decode, analyzer):
+        def timed(frame):
+            if 'data' not in frame.data:
+                return decode(frame)
+            state = analyzer.state.name
+            self.before(frame, state, analyzer.command)
+            frames = decode(frame)
+            # The payload is cleared whenever a command or REPEAT element completes
+            if state != 'Start' and len(analyzer.payload) == 0:
+                self.complete(frame, analyzer)
+            return frames
+        return timed
+
+    def before(self, frame, state, command):
+        byte = frame.data['data'][0]
+        code = command.opcode
+        if self.first_time == None:
+            self.first_time = frame.start_time
+        self.last_time = frame.end_time
+
+        if state == 'Start':
+            if frame.type == 'BREAK' or byte == 0x00:
+                # A BREAK resets the UPDI, GTVAL included
+                self.guard_bits = DEFAULT_GUARD_BITS
+            if byte == 0x55:
+                self.measure_bit(frame)
+                self.start_command(frame)
+        elif self.command_start == None:
+            # The next element of a REPEAT
+            self.start_command(frame)
+
+        # Address and data bytes both arrive in Address or Data, told apart by what is
+        # still to come.  The target sends the ACK, load data and the pointer for LD ptr.
+        address = state in ('Address', 'Data') and command.address_count > 0
+        data = state in ('Address', 'Data') and command.address_count <= 0 and command.data_count > 0
+        from_target = state == 'Ack' or (code != None and ((data and code.type == 'get') or (address and code.name == 'LD ptr')))
+        if from_target and not self.from_target and self.byte_end != None:
+            turnaround = frame.start_time - self.byte_end
+            if state == 'Ack':
+                self.ack_turnaround.add(turnaround)
+            else:
+                self.response_turnaround.add(turnaround)
+            self.turnaround_time += turnaround
+            if self.bit_time != None:
+                self.guard_time += self.guard_bits * self.bit_time
+        self.from_target = from_target
+        self.byte_end = frame.end_time
+        if data:
+            self.payload_bytes += 1
+
+    def measure_bit(self, frame):
+        if self.fixed_bit_time != None:
+            return
+        command = frame.data.get('command', '')
+        if command.startswith('(Baud Rate: '):
+            self.bit_time = 1 / float(command[len('(Baud Rate: '):-1])
+        elif frame.end_time > frame.start_time:
+            self.bit_time = (frame.end_time - frame.start_time) / BYTE_BITS
+
+    def start_command(self, frame):
+        self.command_start = frame.start_time
+        if self.command_end != None:
+            self.gaps.add(frame.start_time - self.command_end)
+
+    def complete(self, frame, analyzer):
+        if self.command_start != None:
+            duration = frame.end_time - self.command_start
+            self.durations.add(duration)
+            self.busy_time += duration
+        self.commands += 1
+        self.command_start = None
+        self.command_end = frame.end_time
+
+        # Follow GTVAL through STCS CTRLA
+        command = analyzer.command
+        code = command.opcode
+        if code != None and code.name == 'STCS' and code.cs == GUARD_REGISTER and len(command.data) > 0:
+            registers = analyzer.device.registers if analyzer.device != None else {}
+            bits = guard_bits(registers.get(GUARD_REGISTER), command.data[0])
+            if bits != None:
+                self.guard_bits = bits
+
+    def as_dict(self):
+        span = self.last_time - self.first_time if self.first_time != None else 0.0
+        return {
+            'commands'              : self.commands,
+            'payload_bytes'         : self.payload_bytes,
+            'span'                  : span,
+            'busy_time'             : self.busy_time,
+            'utilisation'           : self.busy_time / span if span > 0 else None,
+            'payload_rate'          : self.payload_bytes / span if span > 0 else None,
+            'busy_payload_rate'     : self.payload_bytes / self.busy_time if self.busy_time > 0 else None,
+            'guard_bits'            : self.guard_bits,
+            'guard_time'            : self.guard_time if self.bit_time != None else None,
+            'turnaround_time'       : self.turnaround_time,
+            'guard_share'           : self.guard_time / span if span > 0 and self.bit_time != None else None,
+            'durations'             : self.durations.as_dict(),
+            'gaps'                  : self.gaps.as_dict(),
+            'ack_turnaround'        : self.ack_turnaround.as_dict(),
+            'response_turnaround'   : self.response_turnaround.as_dict(),
+        }
+
+    def dump(self, file=None):
+        file = file or sys.stdout
+        timing = self.as_dict()
+        print('UPDI bus timing: %d commands, %d payload bytes over %s' % (
+            timing['commands'], timing['payload_bytes'], seconds(timing['span'])), file=file)
+        if timing['utilisation'] != None:
+            print('  busy %.1f%%, payload %s overall, %s while busy' % (
+                timing['utilisation'] * 100, rate(timing['payload_rate']), rate(timing['busy_payload_rate'])), file=file)
+        for name in ('durations', 'gaps', 'ack_turnaround', 'response_turnaround'):
+            histogram = timing[name]
+            if histogram['count']:
+                print('  %-20s %9d  mean %s  p50 %s  p90 %s  p99 %s  max %s' % (name.replace('_', ' '), histogram['count'],
+                      seconds(histogram['mean']), seconds(histogram['p50']), seconds(histogram['p90']), seconds(histogram['p99']), seconds(histogram['max'])), file=file)
+        if timing['guard_time'] != None:
+            print('  guard time: %s of %s turnaround (%d bits now), %.1f%% of the capture' % (
+                seconds(timing['guard_time']), seconds(timing['turnaround_time']), timing['guard_bits'],
+                timing['guard_share'] * 100 if timing['guard_share'] != None else 0.0), file=file)
+
+def seconds(value):
+    if value == None:
+        return '-'
+    for scale, unit in ((1, 's'), (1e-3, 'ms'), (1e-6, 'us')):
+        if abs(value) >= scale:
+            return '%.3f %s' % (value / scale, unit)
+    return '%.0f ns' % (value * 1e9)
+
+def rate(value):
+    return '%.1f B/s' % value if value != None else '-'
@@ -1,8 +1,15 @@
-from saleae.analyzers import HighLevelAnalyzer, AnalyzerFrame, ChoicesSetting
+from saleae.analyzers import HighLevelAnalyzer, AnalyzerFrame, ChoicesSetting, NumberSetting
 from enum import IntEnum, Enum
-from opcodes import OPCODES, ADDRESS_SIZE, DATA_SIZE, KEY_SIZE
-from registers import REGISTERS
+from opcodes import OPCODE_TABLE
 from dataarray import DataArray
+from frames import Decoded, FrameData, format_frame
+from stats import DecoderStats
+from memory import MemoryImage, region
+from profiles import DEVICE_NAMES, profile
+from index import SessionIndex
+from polling import PollingCompressor
+from resync import Resynchronizer
+from timing import BusTiming
 
 class States(Enum):
     Start =     1
@@ -13,10 +20,88 @@ class States(Enum):
     Ack =       6
     Complete =  7
 
+# State after an opcode, by (opcode type, ACK expected).  Everything else reads an address next.
+OPCODE_TRANSITIONS = {
+    ('unknown', True)   : States.Ack,
+    ('unknown', False)  : States.Complete,
+}
+
+# State after each opcode byte, resolved once
+NEXT_STATE = tuple(
+    None if code == None else OPCODE_TRANSITIONS.get((code.type, code.ack), States.Address)
+    for code in OPCODE_TABLE
+)
+
+# Bytes that follow the opcode before the command completes, given the address and
+# data counts in effect.  The last address byte is also taken as the first data byte.
+def command_bytes(code, address_count, data_count):
+    ack = 1 if code.ack else 0
+    if code.type == 'unknown':
+        return ack
+    if address_count > 0:
+        return address_count + max(data_count - 1, 0) + ack
+    return max(data_count, 1) + ack
+
+# The command being decoded.  One record per analyzer, filled in place by the state
+# handlers.  The address and data counts, CS and ACK carry over into the next command
+# when its opcode does not set them.
+class Command:
+
+    __slots__ = ('opcode', 'mnemonic', 'start_time', 'address', 'data', 'address_count', 'data_count',
+                 'cs', 'acked', 'repeat_byte', 'last_opcode_byte')
+
+    def __init__(self):
+        self.opcode = None              # Opcode from OPCODE_TABLE, None until recognized
+        self.mnemonic = ''              # 'SYNC ' prefixes seen for this command
+        self.start_time = 0
+        self.address = DataArray()
+        self.data = DataArray()
+        self.address_count = 0          # Address bytes still to come (-1 reserved)
+        self.data_count = 0             # Data bytes still to come (-1 reserved)
+        self.cs = 0
+        self.acked = None
+        self.repeat_byte = None         # Opcode byte to reuse for the next REPEAT element
+        self.last_opcode_byte = None
+
+    def copy(self):
+        command = Command()
+        for name in self.__slots__:
+            setattr(command, name, getattr(self, name))
+        command.address = DataArray(self.address)
+        command.data = DataArray(self.data)
+        return command
+
+    # Start of a new command, the carried over fields are left alone
+    def reset(self):
+        self.address.reset()
+        self.data.reset()
+        self.opcode = None
+        self.repeat_byte = None
+        self.last_opcode_byte = None
+
 # High level analyzers must subclass the HighLevelAnalyzer class.
 class hla(HighLevelAnalyzer):
 
+    Device = ChoicesSetting(DEVICE_NAMES)
     ShowUnknownBits = ChoicesSetting(['No', 'Yes'])
+    RepeatFrames = ChoicesSetting(['Each', 'Block'])
+    RepeatFrameLimit = NumberSetting(min_value=0, max_value=65535)
+    Statistics = ChoicesSetting(['Off', 'On'])
+    PollingFrames = ChoicesSetting(['Each', 'Collapse'])
+    Resync = ChoicesSetting(['Off', 'On'])
+
+    # Keep raw decoded fields in each frame and format them on first access.
+    # Logic 2 needs plain dicts, so this is only for offline decoding.
+    lazy_frames = False
+
+    # Rebuild an image of the target's memory from the decoded traffic (hla.memory)
+    track_memory = False
+
+    # Index commands by time, opcode, CS register and memory address as they complete (hla.index)
+    build_index = False
+
+    # Measure command durations, idle gaps, turnarounds and guard time (hla.timing)
+    bus_timing = False
 
     # Result Types supported
     result_types = {
@@ -29,29 +114,110 @@ class hla(HighLevelAnalyzer):
 
         self.state = States.Start
 
-        self.start_time = 0  
-        self.mnemonic = ''
-        self.pseudocode = ''
-        self.response = ''
+        self.command = Command()
         self.payload:DataArray = DataArray()
         self.opcode_start = 0
         self.frames = []
-        self.ack_check = 0
-        self.address_count=0
-        self.data_count=0
-        self.key_count=0
         self.repeat_count= 0
-        self.recognized_opcode = None
+        self.handlers = self.state_handlers()
         self.unknown_bits = True if self.ShowUnknownBits == 'Yes' else False
+        self.device = None
+        self.registers = None
         self.total_repeats = 0
+        self.pointer = None
+        self.memory = None
+        self.index = SessionIndex() if self.build_index else None
+
+        # REPEAT bursts collapsed into a single frame after RepeatFrameLimit elements
+        self.block_repeats = True if self.RepeatFrames == 'Block' else False
+        self.repeat_frame_limit = int(self.RepeatFrameLimit) if isinstance(self.RepeatFrameLimit, (int, float)) else 0
+        self.block_elements = 0
+
+        # Commands cut short when the byte stream turns out to be out of step
+        self.resync = None
+        if self.Resync == 'On':
+            self.resync = Resynchronizer(self)
+            self.decode = self.resynced(self.decode)
+
+        # Polling loops collapsed into a single frame per run
+        self.polling = None
+        if self.PollingFrames == 'Collapse':
+            self.polling = PollingCompressor()
+            self.decode = self.collapse(self.decode)
+
+        # Bus timing analytics, fed the input bytes before anything else sees them
+        self.timing = None
+        if self.bus_timing:
+            self.timing = BusTiming()
+            self.decode = self.timing.decoder(self.decode, self)
+
+        # Decoder statistics, nothing is counted unless enabled
+        self.stats = None
+        if self.Statistics == 'On':
+            self.stats = DecoderStats()
+            self.handlers = self.stats.instrument(self)
+            self.decode = self.stats.decoder(self.decode, self)
+
+        # Device tables are loaded by the first decode call, not when Logic 2 creates the analyzer
+        self.ready_decode = self.decode
+        self.decode = self.first_decode
+
+    # Load the device profile and its register tables.  Profiles are compiled once per
+    # process (and cached on disk), so this is a lookup after the first analyzer.
+    def load_tables(self):
+        if self.device != None:
+            return
+        self.device = profile(self.Device)
+        self.registers = self.device.register_tables[self.unknown_bits]
+        self.register_names, self.register_values = self.registers
+        if self.track_memory:
+            self.memory = MemoryImage(self.device.memory_map)
+
+    def first_decode(self, frame):
+        self.load_tables()
+        self.decode = self.ready_decode
+        return self.ready_decode(frame)
+
+    def dump_stats(self, file=None):
+        if self.stats != None:
+            self.stats.dump(file)
+
+    # Pass decoded frames through the polling compressor
+    def collapse(self, decode):
+        polling = self.polling
+        def collapsed(frame):
+            self.frames = polling.feed(decode(frame))
+            return self.frames
+        return collapsed
+
+    # Check each byte for a lost command boundary before decoding it
+    def resynced(self, decode):
+        resync = self.resync
+        def checked(frame):
+            self.frames = resync.decode(decode, frame)
+            return self.frames
+        return checked
+
+    # Frames still held back at the end of a capture
+    def flush(self):
+        frames = self.resync.flush() if self.resync != None else []
+        if self.polling != None:
+            frames = self.polling.feed(frames) + self.polling.flush()
+        return frames
 
     def addframe(self, mnemonic, pseudocode, response, end_time):    
+        if self.index != None:
+            self.index.add_event(self.command.start_time, end_time, mnemonic.split(' ')[0], self.opcode_start + len(self.payload))
+        if self.lazy_frames:
+            self.emit(Decoded(self.opcode_start + len(self.payload), bytes(self.payload), mnemonic, pseudocode, response), end_time)
+            return
+
         hex = self.payload.toHexString(isSpace=True)
         self.opcode_start += len(self.payload)
-        self.payload = DataArray()
+        self.payload.reset()
 
         # Display the Frame
-        self.frames.append(AnalyzerFrame('UPDI', self.start_time, end_time, {
+        self.frames.append(AnalyzerFrame('UPDI', self.command.start_time, end_time, {
             'count' : '0x%04X' % self.opcode_start,
             'data' : hex,
             'command' : mnemonic,
@@ -59,186 +225,299 @@ class hla(HighLevelAnalyzer):
             'pseudocode' : pseudocode,
         }))
 
+    def emit(self, decoded, end_time):
+        self.opcode_start = decoded.count
+        self.payload.reset()
+
+        # Display the Frame
+        self.frames.append(AnalyzerFrame('UPDI', self.command.start_time, end_time, FrameData(decoded) if self.lazy_frames else format_frame(decoded)))
+
 ######################################################################################### 
 # Capture functions
 ######################################################################################### 
 
+    # Each capture handler returns True when the same byte needs to be
+    # dispatched again in the state it moved to
+
     def capture_start(self, byte, frame):
 
-        self.address = DataArray()
-        self.data = DataArray()
-        self.recognized_opcode = None
-        self.repeat_byte = None
-        self.last_opcode_byte = None
+        command = self.command
+        command.reset()
 
         # Handle special events
         if (byte == 0x55):
             # SYNC event
-            self.mnemonic += 'SYNC '
-            self.start_time = frame.start_time
+            command.mnemonic += 'SYNC '
+            command.start_time = frame.start_time
             self.state = States.Opcode
-            return self.frames
         
         elif (byte == 0xFF):
             # IDLE event
-            self.start_time = frame.start_time
+            command.start_time = frame.start_time
             self.addframe("IDLE", "", "", frame.end_time)
-            self.start_time = 0
-            return self.frames
+            command.start_time = 0
         
         elif (byte == 0x00):
             # BREAK event
-            self.start_time = frame.start_time
+            command.start_time = frame.start_time
             self.addframe("BREAK", "Break", "", frame.end_time)
-            self.start_time = 0
-            return self.frames 
+            command.start_time = 0
         
         else:
             # Standard Data
-            self.start_time = frame.start_time
+            command.start_time = frame.start_time
             self.addframe("UNKNOWN","Unknown","",frame.end_time)
 
-            if (self.start_time == 0):
-                self.start_time = frame.start_time
-        
-        # self.state = States.Opcode
-
     def capture_opcode(self, byte, frame):
 
         # Are we repeating the last opcode?
-        if self.repeat_byte != None:
-            byte = self.repeat_byte
+        command = self.command
+        if command.repeat_byte != None:
+            byte = command.repeat_byte
+        command.last_opcode_byte = byte
 
         # Look it up
-        for code in OPCODES:
-            if (code['value'] == byte & (code['mask'] if 'mask' in code else 0xFF)):
-                # Matched code from list
-                self.recognized_opcode = code.copy()
-                break
+        code = OPCODE_TABLE[byte]
+        command.opcode = code
 
         # Did we find a match?
-        if (self.recognized_opcode != None):
-            # Matched, what else do we need for this opcode?
-            if ('address' in self.recognized_opcode):
-                self.address_count = ADDRESS_SIZE[(byte & 0b1100) >> 2 if self.recognized_opcode['address'] == 'A' else (byte & 0b0011)]
-            if ('data' in self.recognized_opcode):
-                self.data_count = DATA_SIZE[(byte & 0b0011)] if not self.recognized_opcode['data'] == '1' else 1
-            if ('key' in self.recognized_opcode):
-                self.data_count = KEY_SIZE[byte & 0b11]
-            if ('register' in self.recognized_opcode):
-                self.cs = byte & 0b1111     
-            if ('type' in self.recognized_opcode and self.recognized_opcode['type']=='unknown'):
-                if ('ack' in self.recognized_opcode and self.recognized_opcode['ack']== True):
-                    self.state = States.Ack
-                else:
-                    self.state = States.Complete 
-            else:
-                self.state = States.Address
-        else:
-            # No match
+        if (code == None):
             self.addframe('INVALID_OPCODE 0x%02X' % byte, "Invalid Command 0x%02X", "", frame.end_time)
             self.state = States.Start
-        self.last_opcode_byte = byte
+            return False
+
+        # Matched, what else do we need for this opcode?
+        if (code.address_count != None):
+            command.address_count = code.address_count
+        if (code.data_count != None):
+            command.data_count = code.data_count
+        if (code.register):
+            command.cs = code.cs
+        self.state = NEXT_STATE[byte]
+        return self.state == States.Complete
 
     def capture_address(self, byte, frame):
-        if (self.start_time == 0):
-            self.start_time = frame.start_time
+        command = self.command
+        if (command.start_time == 0):
+            command.start_time = frame.start_time
         # If we need address, get it
-        if (self.address_count > 0):
-            self.address.append(byte)
-            self.address_count -= 1
-        # If we are now done with address, move on to data
-        if self.address_count < 1:
-            self.state = States.Data
+        if (command.address_count > 0):
+            command.address.append(byte)
+            command.address_count -= 1
+            if (command.address_count > 0):
+                return False
+        # Done with address, the same byte moves on to data
+        self.state = States.Data
+        return self.capture_data(byte, frame)
 
     def capture_data(self, byte, frame):
         # if we need data, get it
-        if (self.data_count > 0):
-            self.data.append(byte)
-            self.data_count -= 1
-        if self.data_count < 1:
-            self.ack_count = 0
-            if ('ack' in self.recognized_opcode and self.recognized_opcode['ack']==True):
-                self.state = States.Ack
-            else:
-                self.state = States.Complete
+        command = self.command
+        if (command.data_count > 0):
+            command.data.append(byte)
+            command.data_count -= 1
+            if (command.data_count > 0):
+                return False
+        if (command.opcode.ack):
+            self.state = States.Ack
+            return False
+        self.state = States.Complete
+        return True
 
     def capture_ack(self, byte, frame):
         # We expect an ACK
-        if (byte == 0x40):
-            self.response += (' (ACK)')
-        else:
-            self.response += (' (MISSING ACK)')
+        self.command.acked = (byte == 0x40)
         self.state = States.Complete
+        return True
+
+    # Complete this command (Does not require the next byte in the stream to complete)
+    def capture_complete(self, byte, frame):
+        command = self.command
+        if self.in_block():
+            self.block_command(frame)
+        else:
+            self.complete_command(frame)
+
+        # Are we repeating?  (We don't repeat the REPEAT command itself)
+        if (command.opcode.name!='REPEAT') and (self.repeat_count > 0):
+            # We finished a repeat
+            self.repeat_count -= 1
+            if (self.repeat_count > 0):
+                # We need to repeat this command again
+                # We start next cycle with command alread recognized, ready to process address, data, etc
+                command.address.reset()
+                command.data.reset()
+                command.repeat_byte = command.last_opcode_byte
+                self.state = States.Opcode
+                return True
+            if self.block_elements > 0:
+                self.complete_block(frame)
+        self.state = States.Start
+        command.mnemonic = ''
+        return False
+
+    # Handler for each state
+    def state_handlers(self):
+        return {
+            States.Start    : self.capture_start,
+            States.Opcode   : self.capture_opcode,
+            States.Address  : self.capture_address,
+            States.Data     : self.capture_data,
+            States.Ack      : self.capture_ack,
+            States.Complete : self.capture_complete,
+        }
 
     def complete_command(self, frame):
-        code = self.recognized_opcode.copy()
-        command = self.recognized_opcode['name']
-        self.mnemonic += command + ' '
-        self.repeat_text = '#%d ' % ((self.total_repeats+1)-self.repeat_count) if (command!='REPEAT') and (self.repeat_count > 0) else ''
-        data = self.data.toHexString() if self.data_count != -1 else 'RESERVED'
-        ascii_data = self.data.toAsciiString() if self.data_count != -1 else 'RESERVED'
-        address = self.address.toHexString() if self.address_count != -1 else 'RESERVED'
-
-        # Matched to a definition
-        if code['type'] == 'get':
-            # Get 
-            if 'register' in code:
-                # Get CS
-                self.mnemonic += '0x%02X' % self.cs
-                self.response = self.register_data(self.cs, self.data[0]) + self.response
-                self.pseudocode = 'Get %s' % self.register_name(self.cs)
-            elif 'key' in code:
-                self.mnemonic += 'SIB == %s' % ascii_data
-                self.pseudocode = 'Get SIB'
-                self.response = data + self.response
-            elif 'address' in code and 'data' in code:
-                # Get *(address), Response in Data
-                self.mnemonic += '%s' % address
-                self.pseudocode = 'Get *(%s)' % address
-                self.response = data + self.response
-            elif 'data' in code:
-                # Get from current pointer, response in data
-                self.mnemonic += data
-                self.pseudocode = 'Get *(ptr)'
-                self.response = data + self.response
-        elif code['type'] == 'ptr':
-            # Set Pointer
-            self.mnemonic += address
-            self.pseudocode = 'Set pointer = %s' % address     
-        elif code['type'] == 'set':
-            if 'register' in code:
-                # Set Register with Data
-                self.mnemonic += '0x%02X = 0x%02X' % (self.cs, self.data[0])
-                self.pseudocode = 'Set %s' % self.register_data(self.cs, self.data[0])
-            elif 'key' in code:
-                self.mnemonic +=  ascii_data
-                self.pseudocode = 'Set KEY = %s' % ascii_data
-            elif 'address' in code and 'data' in code:
-                # Write at Address from Data
-                self.mnemonic += '%s = %s' % (address, data)
-                self.pseudocode = 'Write *(%s) = %s' % (address, data)
-            elif 'data':
-                # Set Data to pointer address
-                self.mnemonic += data
-                self.pseudocode = 'Write *(pointer++) = %s' % data
-        elif code['type'] == 'repeat':
+        command = self.command
+        code = command.opcode
+        element = (self.total_repeats+1)-self.repeat_count if (code.name!='REPEAT') and (self.repeat_count > 0) else 0
+
+        if code.type == 'repeat':
             # Repeat Command
-            self.repeat_count = self.data.toTotal() + 1
+            self.repeat_count = command.data.toTotal() + 1
             self.total_repeats = self.repeat_count
-            self.mnemonic += 'x %s' % data
-            self.pseudocode = 'Repeat next command %d times' % self.repeat_count
+
+        self.emit(Decoded(
+            count               = self.opcode_start + len(self.payload),
+            payload             = bytes(self.payload),
+            command             = command.mnemonic,
+            opcode              = code,
+            cs                  = command.cs,
+            address             = bytes(command.address),
+            data                = bytes(command.data),
+            address_reserved    = command.address_count == -1,
+            data_reserved       = command.data_count == -1,
+            acked               = command.acked if code.ack else None,
+            element             = element,
+            registers           = self.registers,
+            keys                = self.device.keys,
+        ), frame.end_time)
+        self.index_command(frame)
+        self.track_pointer()
+        command.mnemonic = ''
+        command.start_time = 0
+
+    def index_command(self, frame):
+        if self.index != None:
+            command = self.command
+            self.index.add_command(command.start_time, frame.end_time, command.opcode, command.cs, self.pointer,
+                                   command.address, command.data, command.address_count == -1, self.opcode_start + len(self.payload))
+
+    # Follow the UPDI pointer through ST ptr and *(ptr++) accesses
+    def track_pointer(self):
+        command = self.command
+        code = command.opcode
+        if self.memory != None:
+            self.memory.apply(code, self.pointer, command.address, command.data, command.address_count == -1)
+        if code.name == 'ST ptr':
+            self.pointer = int.from_bytes(command.address, 'little') if command.address_count != -1 else None
+        elif self.pointer != None and code.name.endswith('(ptr++)'):
+            self.pointer += len(command.data)
+
+    # No command in progress and no REPEAT pending
+    def idle(self):
+        return self.state == States.Start and self.repeat_count == 0
+
+    # Complete the command without waiting for more bytes (an ACK that never came)
+    def complete_now(self, frame):
+        self.state = States.Complete
+        self.capture_complete(None, frame)
+
+    # Give up on the command in progress, showing the bytes received so far
+    def abandon_command(self, frame, reason):
+        command = self.command
+        if self.block_elements > 0:
+            self.complete_block(frame)
+        if len(self.payload) > 0:
+            self.addframe('RESYNC', reason, '', frame.end_time)
+        self.state = States.Start
+        self.repeat_count = 0
+        command.mnemonic = ''
+        command.start_time = 0
+
+    # Everything a rollback needs to resume decoding from an earlier byte
+    BLOCK_FIELDS = ('block_elements', 'block_start', 'block_offset', 'block_pointer', 'block_prefix',
+                    'block_first', 'block_bytes', 'block_acks', 'block_missing')
+
+    def save_state(self):
+        return (self.state, self.command.copy(), DataArray(self.payload), self.opcode_start, self.repeat_count,
+                self.total_repeats, self.pointer, {name: getattr(self, name) for name in self.BLOCK_FIELDS if hasattr(self, name)},
+                len(self.index) if self.index != None else 0)
+
+    def restore_state(self, saved):
+        self.state, command, payload, self.opcode_start, self.repeat_count, self.total_repeats, self.pointer, block, rows = saved
+        self.command = command.copy()
+        if self.index != None:
+            # Rows added since are decoded again, in time order
+            self.index.truncate(rows)
+        self.payload = DataArray(payload)
+        for name, value in block.items():
+            setattr(self, name, value)
+
+######################################################################################### 
+# Block transfers
+######################################################################################### 
+
+    # Should this repeated element be folded into a block frame?
+    def in_block(self):
+        if not self.block_repeats or self.command.opcode.name == 'REPEAT' or self.repeat_count < 1:
+            return False
+        return (self.total_repeats+1)-self.repeat_count > self.repeat_frame_limit
+
+    # Accumulate a repeated element without formatting it
+    def block_command(self, frame):
+        command = self.command
+        if self.block_elements == 0:
+            self.block_start = command.start_time
+            self.block_offset = self.opcode_start
+            self.block_pointer = self.pointer
+            self.block_prefix = command.mnemonic
+            self.block_first = (self.total_repeats+1)-self.repeat_count
+            self.block_bytes = 0
+            self.block_acks = 0
+            self.block_missing = 0
+        self.block_elements += 1
+        self.block_bytes += len(command.data)
+        if command.opcode.ack:
+            if command.acked:
+                self.block_acks += 1
+            else:
+                self.block_missing += 1
+        self.index_command(frame)
+        self.track_pointer()
+
+        # The element's bytes are referenced by offset, not kept
+        self.opcode_start += len(self.payload)
+        self.payload.reset()
+        command.mnemonic = ''
+        command.start_time = 0
+
+    # Emit one frame for the whole block
+    def complete_block(self, frame):
+        code = self.command.opcode
+        pointer = '0x%04X' % self.block_pointer if self.block_pointer != None else 'ptr'
+        if code.type == 'set':
+            pseudocode = 'Write %d bytes to *(%s)' % (self.block_bytes, pointer)
+        elif code.type == 'get':
+            pseudocode = 'Get %d bytes from *(%s)' % (self.block_bytes, pointer)
         else:
-            # Unknown Command
-            self.mnemonic += 'UNKNOWN COMMAND'
-            self.pseudocode = 'Unknown Command'
-            self.state = States.Ack
+            pseudocode = '%d bytes' % self.block_bytes
+        response = ''
+        if code.ack:
+            response = ' (%d ACK)' % self.block_acks if self.block_missing == 0 else ' (%d ACK, %d MISSING ACK)' % (self.block_acks, self.block_missing)
 
-        self.pseudocode = self.repeat_text + self.pseudocode
-        self.addframe(self.mnemonic, self.pseudocode, self.response, frame.end_time)
-        self.mnemonic = ''
-        self.response = ''
-        self.start_time = 0
+        self.frames.append(AnalyzerFrame('UPDI', self.block_start, frame.end_time, {
+            'count' : '0x%04X' % self.opcode_start,
+            'data' : '0x%04X-0x%04X' % (self.block_offset, self.opcode_start),
+            'command' : '%s%s x %d' % (self.block_prefix, code.name, self.block_elements),
+            'response' : response,
+            'pseudocode' : '#%d-#%d %s' % (self.block_first, self.block_first + self.block_elements - 1, pseudocode),
+            'pointer' : self.block_pointer if self.block_pointer != None else -1,
+            'elements' : self.block_elements,
+            'bytes' : self.block_bytes,
+            'offset' : self.block_offset,
+        }))
+        self.block_elements = 0
 
 ######################################################################################### 
 # Main DECODE Routine
@@ -256,62 +535,11 @@ class hla(HighLevelAnalyzer):
             self.payload.append(byte)
         else:
             return self.frames
-        
-        while True:
-
-            # Start State = beginning of new command
-            if (self.state == States.Start):
-                self.capture_start(byte, frame)
-                return self.frames
-            
-            # Process the Opcode                       
-            if (self.state == States.Opcode):
-                self.capture_opcode(byte, frame)    
-                if (self.state != States.Complete):
-                    return self.frames               
-
-            # Process an Address, if required               
-            if (self.state == States.Address):
-                self.capture_address(byte, frame)
-                if (self.state != States.Data):
-                    return self.frames
-
-            # Process any Data, if required
-            if (self.state == States.Data): 
-                self.capture_data(byte, frame)     
-                if (self.state != States.Complete):
-                    return self.frames
-            
-            # Look for an ACK if expected
-            if (self.state == States.Ack):
-                self.capture_ack(byte, frame)
-
-            # Complete this command (Does not require the next byte in the stream to complete)
-            if (self.state == States.Complete):
-                self.complete_command(frame)
-
-                # Are we repeating?  (We don't repeat the REPEAT command itself)
-                if (self.recognized_opcode['name']!='REPEAT') and (self.repeat_count > 0):
-                    # We finished a repeat
-                    self.repeat_opcode = self.recognized_opcode
-                    self.repeat_count -= 1
-                    if (self.repeat_count > 0):
-                        # We need to repeat this command again
-                        # We start next cycle with command alread recognized, ready to process address, data, etc
-                        self.address = DataArray()
-                        self.data = DataArray()
-                        self.repeat_byte = self.last_opcode_byte
-                        self.state = States.Opcode
-                    else:
-                        self.state = States.Start
-                        break
-                else:
-                    self.state = States.Start
-                    break
-
-
-        self.mnemonic = ''
-        self.pseudocode = ''
+
+        # One dispatch per byte, unless a handler passes the byte on to the next state
+        handlers = self.handlers
+        while handlers[self.state](byte, frame):
+            pass
 
         # Get the next byte and keep processing
         return self.frames 
@@ -321,98 +549,24 @@ class hla(HighLevelAnalyzer):
 ######################################################################################### 
 
     def register_definition(self, cs):
-
-        # Look up the register
-        for register in REGISTERS:
-            # See if our value matches the defined register number
-            if 'number' in register and register['number'] == cs:
-                return register
-        return None
+        registers = self.device.registers
+        return registers[cs] if cs in registers else None
 
     def register_name(self, cs):
-        register = self.register_definition(cs)
-        return register['name'] if 'name' in register else ''
+        return self.register_names[cs]
 
     # Decode the CS register names and values
     def register_data(self, cs, data):
-        
-        register_parts = []
-
-        # Defaults if no definition is found
-        register = self.register_definition(cs)
-        if (register != None):
-
-            # Matched, use the defiend name
-            if 'name' in register:
-                register_name = '0x%02X (%s)' % (cs, register['name'])
-
-            # Check if this register has one or more defined portions
-            if 'components' in register:
-                for component in register['components']:
-                    
-                    # Handle groups of bits
-                    if 'bits' in component and self.unknown_bits==True:
-                        for bit in component['bits']:
-                            component_value = ((1 << bit) & data) >> (bit)
-                            component_name = component['name'] if 'name' in component else 'Bit%d' % bit
-                            register_parts.append('%s %s' % (component_name, 'on' if component_value>0 else 'off' ))
-
-                    # Handle individual bit
-                    elif ('bit' in component):
-                        component_value = ((1 << component['bit']) & data) >> (component['bit'])
-                        if 'values' in component:
-                            component_definition = component['values'][component_value]
-                        else:
-                            component_definition = 'on' if component_value>0 else 'off'
-                        component_name = component['name'] if 'name' in component else 'Bit%d' % component['bit']
-                        register_parts.append('%s = %s' % (component_name, component_definition))
-
-                    # Handle masked amounts
-                    elif ('mask' in component):
-                        component_value = (data & component['mask']) >> (component['shift'] if 'shift' in component else 0)
-                        if ('values' in component and component_value in component['values']):
-                            component_definition = component['values'][component_value]
-                        else:
-                            component_definition = '0x%02X' % component_value
-                        component_name = component['name'] if 'name' in component else 'Unnamed Mask %02X' % component['mask']
-                        register_parts.append('%s = %s' % (component_name, component_definition ))
-
-            # Assume Full byte value
-            else:
-                component_definition = register['values'][data] if ('values' in register and data in register['values']) else '0x%02X' % data
-                component_name = register['name'] if 'name' in register else 'Register %02X' % cs
-                register_parts.append('%s = %s' % (component_name, component_definition ))
-
-        return (' ,'.join(register_parts))
+        return self.register_values[cs][data]
 
 ######################################################################################### 
 # Memory Decoding
 ######################################################################################### 
 
     def MemoryMap(self, address, value, direction='='):
-        if address <= 0x003F:
-            register = ''
-            offset = address - 0x003F
-            if (offset==0x00):
-                register = 'GPIOR0'
-            elif (offset==0x01):
-                register = 'GPIOR1'
-            elif (offset==0x02):
-                register = 'GPIOR2'
-            elif (offset==0x03):
-                register = 'GIPOR3'
-            mnemonics = 'I/O Reg 0x%04X %d (0x%2X:%s)' % (address, direction, value, register)
-        elif address <= 0x0FFF:
-            mnemonics = 'Ext. I/O Reg 0x%04X %d (0x%2X)' % (address, direction, value)
-        elif address <=0x13FF:
-            mnemonics = 'NVM I/O 0x%04X %d (0x%2X)' % (address, direction, value)
-        elif address <= 0x37FF:
-            mnemonics = 'RESERVED 0x%04X %d (0x%2X)' % (address, direction, value)
-        elif address <= 0x3FFF:
-            mnemonics = 'Internal SRAM 0x%04X %d (0x%2X)' % (address, direction, value)
-        elif address <= 0x7FFF:
-            mnemonics = 'RESERVED 0x%04X %d (0x%2X)' % (address, direction, value)
-        elif address <= 0xBFFF:
-            mnemonics = 'FLASH 0x%04X %d (0x%2X)' % (address, direction, value)
-        elif address <= 0xFFFF:
-            mnemonics = 'RESERVED 0x%04X %d (0x%2X)' % (address, direction, value)
+        found = region(address, self.device.memory_map)
+        io_registers = self.device.io_registers
+        name = found[0] if found != None else 'UNKNOWN'
+        if address in io_registers:
+            return '%s 0x%04X %s (0x%02X:%s)' % (name, address, direction, value, io_registers[address])
+        return '%s 0x%04X %s (0x%02X)' % (name, address, direction, value)
@@ -0,0 +1,77 @@
+import os
+import sys
+import random
+import difflib
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'hl_updi'))
+
+import offline      # Installs the saleae.analyzers stand-in
+import compare
+
+# Longest common subsequence, the most a diff can keep
+def common_length(a, b):
+    previous = [0] * (len(b) + 1)
+    for x in a:
+        row = [0]
+        for index, y in enumerate(b):
+            row.append(previous[index] + 1 if x == y else max(previous[index + 1], row[-1]))
+        previous = row
+    return previous[-1]
+
+# Check that everything between the regions is the same on both sides, returning how
+# many elements that is
+def kept(a, b, regions):
+    x = y = 0
+    count = 0
+    for region in regions + [compare.Region(len(a), len(a), len(b), len(b))]:
+        assert region.golden_start >= x and region.other_start >= y
+        assert region.golden_start - x == region.other_start - y
+        assert a[x:region.golden_start] == b[y:region.other_start]
+        count += region.golden_start - x
+        x, y = region.golden_end, region.other_end
+    return count
+
+def edited(rnd, sequence, alphabet, edits):
+    sequence = list(sequence)
+    for _ in range(edits):
+        choice = rnd.random()
+        position = rnd.randint(0, len(sequence))
+        if choice < .4:
+            sequence.insert(position, rnd.randrange(alphabet))
+        elif sequence and choice < .7:
+            del sequence[min(position, len(sequence) - 1)]
+        elif sequence:
+            sequence[min(position, len(sequence) - 1)] = rnd.randrange(alphabet)
+    return sequence
+
+@pytest.mark.parametrize('seed', range(40))
+def test_regions_against_sequence_matcher(seed):
+    rnd = random.Random(seed)
+    alphabet = rnd.randint(2, 8)
+    a = [rnd.randrange(alphabet) for _ in range(rnd.randint(0, 80))]
+    b = edited(rnd, a, alphabet, rnd.randint(0, 12)) if seed & 1 else [rnd.randrange(alphabet) for _ in range(rnd.randint(0, 80))]
+    regions = compare.diff_sequences(a, b)
+    # Myers' alignment is a shortest edit script, SequenceMatcher only a good one
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    assert kept(a, b, regions) == common_length(a, b)
+    assert kept(a, b, regions) >= sum(block.size for block in matcher.get_matching_blocks())
+    # Touching regions are merged
+    assert all(first.golden_end < second.golden_start or first.other_end < second.other_start
+               for first, second in zip(regions, regions[1:]))
+
+def test_same_sequences_have_no_regions():
+    sequence = list(range(50)) * 3
+    assert compare.diff_sequences(sequence, list(sequence)) == []
+
+@pytest.mark.parametrize('seed', range(10))
+def test_cost_limit_gives_up_on_a_region(seed):
+    rnd = random.Random(seed)
+    a = [rnd.randrange(4) for _ in range(200)]
+    b = a[:50] + [rnd.randrange(4, 8) for _ in range(100)] + a[150:]
+    regions = compare.diff_sequences(a, b, limit=8)
+    # Fewer common elements kept, but what is kept still lines up
+    assert kept(a, b, regions) >= 100
+    assert regions[0].golden_start >= 50 and regions[-1].golden_end <= 150
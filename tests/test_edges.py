@@ -0,0 +1,201 @@
+import os
+import sys
+import random
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'hl_updi'))
+
+import offline      # Installs the saleae.analyzers stand-in
+import edges
+
+pytestmark = pytest.mark.skipif(edges.numpy == None, reason='NumPy is not installed')
+
+# Levels of a UPDI frame: start, 8 data, even parity, 2 stop
+def frame_bits(value):
+    return [0] + [(value >> bit) & 1 for bit in range(8)] + [bin(value).count('1') & 1, 1, 1]
+
+# Bit of the frame each broken framing item has the wrong level in
+BROKEN_BITS = {'PARITY': 9, 'STOP': 10}
+
+# Transition times for segments of (bit rate, [byte or 'BREAK' or ('GLITCH', count) or
+# ('PARITY' or 'STOP', byte)]), the line idle high before the first
+def transitions(segments, start=1e-3):
+    time = start
+    level = 1
+    times = []
+    for baud, items in segments:
+        width = 1 / baud
+        for item in items:
+            if item == 'BREAK':
+                if level:
+                    times.append(time)
+                times.append(time + 24 * 250e-6)
+                time += 24 * 250e-6 + 2 * width
+                level = 1
+            elif isinstance(item, tuple) and item[0] == 'GLITCH':
+                # Pulses far narrower than a bit, ending high
+                for edge in range(2 * item[1]):
+                    times.append(time)
+                    time += width / 20
+                level = 1 if level else 0
+                time += 4 * width
+            else:
+                if isinstance(item, tuple):
+                    bits = frame_bits(item[1])
+                    bits[BROKEN_BITS[item[0]]] ^= 1
+                else:
+                    bits = frame_bits(item)
+                for bit in bits:
+                    if bit != level:
+                        times.append(time)
+                        level = bit
+                    time += width
+                time += width
+    return times
+
+# Each edge moved by up to amount of a bit at the rate of its segment
+def jittered(rnd, segments, amount, start=1e-3):
+    times = []
+    for baud, items in segments:
+        edges = transitions([(baud, items)], start)
+        times += [time + rnd.uniform(-amount, amount) / baud for time in edges]
+        start = edges[-1] + 20 / baud
+    return times
+
+def frames_of(frames):
+    return [(frame.type, frame.data['data'][0]) for frame in frames]
+
+def timed(frames):
+    return [(frame.type, frame.data['data'][0], frame.start_time, frame.end_time, frame.data.get('command')) for frame in frames]
+
+def vectorized(times, block, chunk=1000):
+    return list(edges.iter_edge_frames(1, [times[index:index + chunk] for index in range(0, len(times), chunk)], 0.0, block))
+
+def sequential(times):
+    return list(edges.decode_edges(1, times, 0.0))
+
+def command(rnd, count):
+    return [0x55] + [rnd.randrange(256) for _ in range(count)]
+
+def bytes_of(frames):
+    return [frame for frame in frames_of(frames) if frame[0] in ('SYNC', 'DATA')]
+
+# Bytes as received, whatever their parity and stop bits (EdgeDecoder does not check them)
+def received(frames):
+    return [frame.data['data'][0] for frame in frames if frame.type in ('SYNC', 'DATA', 'PARITY_ERROR', 'FRAMING_ERROR')]
+
+def sent(segments):
+    values = []
+    for baud, items in segments:
+        for item in items:
+            if isinstance(item, int):
+                values.append(item)
+            elif item[0] in BROKEN_BITS:
+                values.append(item[1])
+    return values
+
+# Block sizes, with the chunk size the edges arrive in
+BLOCKS = ((1 << 20, 1000), (333, 50), (64, 7), (11, 1))
+
+def commands(rnd, segments, broken=0):
+    result = []
+    for index in range(segments):
+        items = command(rnd, rnd.randint(4, 40))
+        for _ in range(broken):
+            position = rnd.randrange(1, len(items))
+            if isinstance(items[position], int):
+                items[position] = (rnd.choice(tuple(BROKEN_BITS)), items[position])
+        result.append((rnd.choice((115200, 225000, 500000)), ([] if index == 0 else ['BREAK']) + items))
+    return result
+
+# Pulses outside bytes are reported one by one, not as ll_analyzer reports them while
+# hunting for a SYNC, so only the bytes are compared with it
+def test_glitch_burst_longer_than_a_block():
+    rnd = random.Random(1)
+    times = transitions([(250000, command(rnd, 8) + [('GLITCH', 300)] + command(rnd, 8))])
+    whole = frames_of(vectorized(times, 1 << 20))
+    assert bytes_of(vectorized(times, 1 << 20)) == bytes_of(sequential(times))
+    for block in (64, 100):
+        assert frames_of(vectorized(times, block, chunk=16)) == whole
+
+@pytest.mark.parametrize('seed', range(4))
+def test_rate_change_without_break(seed):
+    rnd = random.Random(seed)
+    # Only a faster SYNC is found by a decoder synchronized to a slower rate, going back
+    # down takes a BREAK
+    segments = [(250000, command(rnd, rnd.randint(4, 40)))]
+    for baud in (500000, 1000000):
+        segments.append((baud, command(rnd, rnd.randint(4, 40))))
+    segments.append((250000, ['BREAK'] + command(rnd, rnd.randint(4, 40))))
+    segments.append((1000000, command(rnd, rnd.randint(4, 40))))
+    times = transitions(segments)
+    expected = sequential(times)
+    assert ('DATA', segments[-1][1][-1]) in frames_of(expected)[-3:]
+    for block in (1 << 20, 333, 64):
+        assert frames_of(vectorized(times, block)) == frames_of(expected)
+
+def test_blocks_match_sequential():
+    rnd = random.Random(5)
+    segments = []
+    for index in range(40):
+        baud = rnd.choice((115200, 225000, 500000, 900000))
+        segments.append((baud, ([] if index == 0 else ['BREAK']) + command(rnd, rnd.randint(1, 100))))
+    times = transitions(segments)
+    expected = sequential(times)
+    for block in (1 << 20, 5000, 777):
+        frames = vectorized(times, block)
+        assert frames_of(frames) == frames_of(expected)
+
+
+# EdgeDecoder samples every bit from the width of one SYNC start bit, so it only reads
+# lightly jittered bytes right
+@pytest.mark.parametrize('seed', range(20))
+def test_jitter_matches_sequential(seed):
+    rnd = random.Random(seed)
+    segments = commands(rnd, rnd.randint(1, 3))
+    times = jittered(rnd, segments, 0.03)
+    expected = received(sequential(times))
+    assert expected == sent(segments)
+    for block, chunk in BLOCKS:
+        assert received(vectorized(times, block, chunk)) == expected
+
+# With heavier jitter pulses turn NARROW and stretches end, whatever the block size
+@pytest.mark.parametrize('seed', range(20))
+def test_heavy_jitter_same_in_every_block(seed):
+    rnd = random.Random(seed)
+    segments = commands(rnd, rnd.randint(1, 3))
+    times = jittered(rnd, segments, 0.15)
+    whole = timed(vectorized(times, *BLOCKS[0]))
+    for block, chunk in BLOCKS[1:]:
+        assert timed(vectorized(times, block, chunk)) == whole
+
+@pytest.mark.parametrize('seed', range(10))
+def test_glitches_match_sequential(seed):
+    rnd = random.Random(seed)
+    segments = commands(rnd, rnd.randint(1, 3))
+    for baud, items in segments:
+        # In front of a command, as a SYNC is needed to pick the bytes up again
+        items.insert(items.index(0x55), ('GLITCH', rnd.randint(1, 30)))
+    times = transitions(segments)
+    expected = received(sequential(times))
+    assert expected == sent(segments)
+    whole = timed(vectorized(times, *BLOCKS[0]))
+    assert received(vectorized(times, *BLOCKS[0])) == expected
+    for block, chunk in BLOCKS[1:]:
+        assert timed(vectorized(times, block, chunk)) == whole
+
+@pytest.mark.parametrize('seed', range(10))
+def test_broken_framing_matches_sequential(seed):
+    rnd = random.Random(seed)
+    segments = commands(rnd, rnd.randint(1, 3), broken=3)
+    times = transitions(segments)
+    expected = received(sequential(times))
+    assert expected == sent(segments)
+    errors = sum(1 for baud, items in segments for item in items if isinstance(item, tuple))
+    whole = vectorized(times, *BLOCKS[0])
+    assert received(whole) == expected
+    assert sum(1 for frame in whole if frame.type in ('PARITY_ERROR', 'FRAMING_ERROR')) == errors
+    for block, chunk in BLOCKS[1:]:
+        assert timed(vectorized(times, block, chunk)) == timed(whole)
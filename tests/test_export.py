@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'hl_updi'))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+import offline      # Installs the saleae.analyzers stand-in
+import export
+from opcodes import OPCODES
+import traffic
+from test_golden import noise
+
+WORKLOADS = {
+    'mixed' : traffic.mixed,
+    'flash' : lambda: traffic.flash(16),
+    'noise' : noise,
+}
+
+# The row each frame should come back as, taken from the frame itself
+def expected_row(frame):
+    if 'repeats' in frame.data:
+        return (frame.start_time, frame.end_time, export.KIND_POLL, export.NO_CS, export.NO_ADDRESS, b'',
+                export.ACK_NONE, frame.data['repeats'], int(frame.data['count'], 16))
+    if 'elements' in frame.data:
+        return (frame.start_time, frame.end_time, export.KIND_BLOCK, export.NO_CS, frame.data['pointer'] & export.NO_ADDRESS, b'',
+                export.ACK_NONE, frame.data['elements'], int(frame.data['count'], 16))
+    decoded = frame.data.decoded
+    code = decoded.opcode
+    if code == None:
+        return (frame.start_time, frame.end_time, export.KINDS.get(decoded.command, export.KIND_INVALID), export.NO_CS,
+                export.NO_ADDRESS, decoded.payload, export.ACK_NONE, 0, decoded.count)
+    assert OPCODES[code.index]['name'] == code.name
+    ack = export.ACK_NONE if decoded.acked == None else export.ACK_OK if decoded.acked else export.ACK_MISSING
+    address = int.from_bytes(decoded.address, 'little') if code.address and not decoded.address_reserved else export.NO_ADDRESS
+    return (frame.start_time, frame.end_time, code.index, decoded.cs if code.register else export.NO_CS, address,
+            decoded.data, ack, decoded.element, decoded.count)
+
+def loaded_rows(path):
+    columns, payload = export.load(path)
+    result = []
+    for row in range(len(columns['opcode'])):
+        offset = int(columns['payload_offset'][row])
+        result.append((float(columns['start_time'][row]), float(columns['end_time'][row]), int(columns['opcode'][row]),
+                       int(columns['cs'][row]), int(columns['address'][row]),
+                       payload[offset:offset + int(columns['data_length'][row])], int(columns['ack'][row]),
+                       int(columns['element'][row]), int(columns['count'][row])))
+    return result
+
+@pytest.mark.parametrize('settings', [{}, {'RepeatFrames': 'Block'}, {'PollingFrames': 'Collapse'}, {'Resync': 'On'}])
+@pytest.mark.parametrize('workload', sorted(WORKLOADS))
+def test_round_trip(workload, settings, tmp_path):
+    records = WORKLOADS[workload]()
+    frames = offline.decode_records(records, lazy_frames=True, **settings)
+    rows = export.export_records(records, str(tmp_path), batch_size=1000, **settings)
+    assert rows == len(frames)
+    assert loaded_rows(str(tmp_path)) == [expected_row(frame) for frame in frames]
+
+# Batches only change how the columns are written
+def test_batch_size(tmp_path):
+    records = traffic.mixed()
+    export.export_records(records, str(tmp_path / 'one'), batch_size=1)
+    export.export_records(records, str(tmp_path / 'all'))
+    assert loaded_rows(str(tmp_path / 'one')) == loaded_rows(str(tmp_path / 'all'))
+
+def test_empty_capture(tmp_path):
+    assert export.export_records([], str(tmp_path)) == 0
+    assert loaded_rows(str(tmp_path)) == []
@@ -0,0 +1,100 @@
+import os
+import sys
+import gzip
+import json
+import random
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(ROOT), 'hl_updi'))
+sys.path.insert(0, os.path.join(os.path.dirname(ROOT), 'bench'))
+
+import offline      # Installs the saleae.analyzers stand-in
+import fastpath
+import traffic
+
+#########################################################################################
+# Golden output
+#
+# Frames of the byte by byte decoder as it was before the offline engine, the state
+# handler table, the fast path and the reusable command record went in, kept in
+# tests/golden/ and compared frame for frame (type, times and every field).  The only
+# changes made to them since are the GTVAL field of CTRLA, shown from the right bits,
+# and KEY pseudocode naming the key from the device profile.
+#
+# The Samples/*.sal sessions cannot be read without Logic 2, so the workloads of
+# bench/traffic.py stand in for them, with a stream of random commands and stray
+# bytes for the decoding of broken traffic.
+#
+# python tests/test_golden.py writes the files again, after a change to the output
+# that is meant.
+#########################################################################################
+
+GOLDEN = os.path.join(ROOT, 'golden')
+
+# Commands and stray bytes, the way a capture that lost bytes looks
+def noise(seed=11, commands=1000):
+    rnd = random.Random(seed)
+    stream = []
+    for _ in range(commands):
+        choice = rnd.random()
+        if choice < .5:
+            stream += [0x55, rnd.randrange(256)] + [rnd.randrange(256) for _ in range(rnd.randint(0, 4))]
+            if rnd.random() < .3:
+                stream.append(0x40)
+        elif choice < .6:
+            stream += [0x55, 0xA0, rnd.randrange(8), 0x55, rnd.choice((0x64, 0x65, 0x24, 0x25, 0x60))]
+            stream += [rnd.randrange(256) for _ in range(rnd.randint(0, 20))]
+        elif choice < .7:
+            stream += [0x55, rnd.choice((0xE0, 0xE5, 0xE6, 0xE7))] + [rnd.randrange(256) for _ in range(rnd.randint(0, 33))]
+        else:
+            stream.append(rnd.randrange(256))
+    return [(index * 1e-5, index * 1e-5 + 9e-6, byte) for index, byte in enumerate(stream)]
+
+WORKLOADS = {
+    'polling'   : lambda: traffic.polling(2000),
+    'keys'      : lambda: traffic.keys(200),
+    'flash'     : lambda: traffic.flash(16),
+    'idle'      : lambda: traffic.idle(20, 100),
+    'mixed'     : traffic.mixed,
+    'noise'     : noise,
+}
+
+def golden_path(name):
+    return os.path.join(GOLDEN, name + '.json.gz')
+
+def rows(frames):
+    return [[frame.type, frame.start_time, frame.end_time, frame.data] for frame in frames]
+
+def load(name):
+    with gzip.open(golden_path(name), 'rt') as file:
+        return json.load(file)
+
+def write(name):
+    with gzip.open(golden_path(name), 'wt') as file:
+        json.dump(rows(offline.decode_records(WORKLOADS[name]())), file, separators=(',', ':'))
+
+# Where two decodes part, for a readable failure
+def first_difference(expected, frames):
+    for index, (row, frame) in enumerate(zip(expected, frames)):
+        if row != frame:
+            return index, row, frame
+    return min(len(expected), len(frames)), len(expected), len(frames)
+
+@pytest.mark.parametrize('name', sorted(WORKLOADS))
+def test_decode_records(name):
+    frames = rows(offline.decode_records(WORKLOADS[name]()))
+    expected = load(name)
+    assert frames == expected, first_difference(expected, frames)
+
+@pytest.mark.parametrize('name', sorted(WORKLOADS))
+def test_decode_records_fast(name):
+    frames = rows(fastpath.decode_records_fast(WORKLOADS[name]()))
+    expected = load(name)
+    assert frames == expected, first_difference(expected, frames)
+
+if __name__ == '__main__':
+    os.makedirs(GOLDEN, exist_ok=True)
+    for name in WORKLOADS:
+        write(name)
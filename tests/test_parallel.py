@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'hl_updi'))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+import offline      # Installs the saleae.analyzers stand-in
+import parallel
+import traffic
+
+WORKLOADS = {
+    'mixed' : traffic.mixed,
+    'flash' : lambda: traffic.flash(128),
+}
+
+def rows(frames):
+    return [(frame.type, frame.start_time, frame.end_time, frame.data) for frame in frames]
+
+def check(records, workers, **settings):
+    assert rows(parallel.decode_parallel(records, workers, **settings)) == rows(offline.decode_records(records, **settings))
+
+# Just under, at and just over the sizes where the capture is cut into more segments
+@pytest.mark.parametrize('length', [parallel.MINIMUM_SEGMENT - 1, parallel.MINIMUM_SEGMENT, 2 * parallel.MINIMUM_SEGMENT - 1,
+                                    2 * parallel.MINIMUM_SEGMENT, 2 * parallel.MINIMUM_SEGMENT + 1, 3 * parallel.MINIMUM_SEGMENT + 7])
+@pytest.mark.parametrize('workload', ['mixed', 'flash'])
+def test_minimum_segment_sizes(workload, length):
+    records = WORKLOADS[workload]()
+    assert len(records) >= length
+    check(records[:length], 2)
+
+# Short segments, so that seams land inside commands and REPEAT blocks
+@pytest.mark.parametrize('workload', ['mixed', 'flash', 'polling'])
+def test_seams_inside_commands(workload, monkeypatch):
+    monkeypatch.setattr(parallel, 'MINIMUM_SEGMENT', 50)
+    records = traffic.WORKLOADS[workload]()[:8000]
+    assert len(parallel.split_points(records, 12)) > 10
+    check(records, 3)
+    check(records, 3, RepeatFrames='Block')
+
+def test_whole_capture_settings_are_refused():
+    for name in parallel.WHOLE_CAPTURE_SETTINGS:
+        with pytest.raises(ValueError):
+            parallel.decode_parallel(traffic.idle(1), 2, **{name: True})
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'hl_updi'))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+import offline      # Installs the saleae.analyzers stand-in
+import compare
+import polling
+import traffic
+
+# Byte records of a debugger waiting for the target: polls (LDCS STATUSA and LDCS
+# ASI_SYS_STATUS) between a STCS and a KEY
+def session(polls, spacing=0):
+    capture = traffic.Traffic()
+    capture.stcs(0x03, 0x08)
+    for index in range(polls):
+        capture.ldcs(0x00, 0x30).ldcs(0x0B, 0x82)
+        capture.idle(spacing)
+    capture.key()
+    return capture.records
+
+def commands(frames):
+    return [frame.data['command'] for frame in frames]
+
+def collapsed(records, **settings):
+    return offline.decode_records(records, PollingFrames='Collapse', **settings)
+
+def run_command(polls):
+    return 'POLL SYNC LDCS 0x00 / SYNC LDCS 0x0B x %d' % polls
+
+# Runs shorter than POLL_HOLD
+@pytest.mark.parametrize('polls', [4, 5, 17, 150])
+def test_run_of_any_length_is_one_frame(polls):
+    frames = collapsed(session(polls))
+    each = offline.decode_records(session(polls))
+    assert commands(frames) == [each[0].data['command'], run_command(polls), each[-1].data['command']]
+    assert frames[1].data['repeats'] == polls
+    assert (frames[1].start_time, frames[1].end_time) == (each[1].start_time, each[-2].end_time)
+
+@pytest.mark.parametrize('polls', [4, 300, 5000])
+def test_compressor_run_of_any_length_is_one_frame(polls):
+    compressor = polling.PollingCompressor(hold=float('inf'))
+    frames = compressor.feed(offline.decode_records(session(polls))) + compressor.flush()
+    assert commands(frames)[1:-1] == [run_command(polls)]
+
+@pytest.mark.parametrize('polls', [4, 17, 100])
+def test_idle_between_repeats_is_part_of_the_run(polls):
+    assert commands(collapsed(session(polls, spacing=3)))[1] == run_command(polls)
+
+def test_short_run_is_shown_as_it_is():
+    frames = collapsed(session(3))
+    assert commands(frames) == commands(offline.decode_records(session(3)))
+
+# A run longer than POLL_HOLD is shown a part at a time, the repeats adding up
+def test_long_run_is_shown_as_it_goes():
+    records = session(2000)
+    frames = collapsed(records)[1:-1]
+    span = frames[-1].end_time - frames[0].start_time
+    assert span > 2 * polling.POLL_HOLD
+    assert len(frames) > 1
+    assert sum(frame.data['repeats'] for frame in frames) == 2000
+    assert all(frame.end_time - frame.start_time < polling.POLL_HOLD + 1e-3 for frame in frames)
+
+@pytest.mark.parametrize('polls', [2, 4, 5, 17, 300])
+def test_compare_ignores_run_length(polls):
+    golden = offline.decode_records(session(10))
+    assert compare.compare_frames(golden, offline.decode_records(session(polls))).same()
+    assert compare.compare_frames(golden, offline.decode_records(session(polls, spacing=2))).same()
+    assert not compare.compare_frames(golden, offline.decode_records(session(polls)[:-10])).same()